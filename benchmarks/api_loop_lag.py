@@ -0,0 +1,76 @@
+# event loop lag while 12 scene jobs are polled, blocking client (how api_reqs used requests) vs the pooled aiohttp session
+# run from the repo root: python -m benchmarks.api_loop_lag [--jobs 12] [--rounds 5] [--delay 0.1]
+import argparse
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+import numpy as np
+from benchmarks.mock_api import MockAPI
+from src.utils.api_reqs import close_session, create_request
+
+TICK = 0.01  # the lag monitor wants to wake up this often
+
+
+def serve_in_thread(delay):
+    # the api lives on its own loop, a blocking client on the bot's loop would otherwise deadlock it
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        holder["loop"] = loop
+        holder["api"] = loop.run_until_complete(MockAPI(delay).start())
+        holder["api"].script("/videos/pending", (200, {"status": 1}))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return holder["api"], holder["loop"]
+
+async def blocking_poll(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+async def pooled_poll(url):
+    return await create_request(url, {}, method="get")
+
+async def monitor(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+async def measure(poll, url, jobs, rounds):
+    lags = []
+    stop = asyncio.Event()
+    monitor_task = asyncio.create_task(monitor(lags, stop))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(poll(url) for _ in range(jobs)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor_task
+    await close_session()
+    return elapsed, np.array(lags) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=12)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.1, help="seconds the mock api takes to answer")
+    args = parser.parse_args()
+
+    api, api_loop = serve_in_thread(args.delay)
+    url = api.url("/videos/pending")
+    print(f"{args.jobs} jobs x {args.rounds} polling rounds, api answers in {args.delay * 1000:.0f} ms")
+    for name, poll in (("blocking", blocking_poll), ("pooled", pooled_poll)):
+        elapsed, lags = asyncio.run(measure(poll, url, args.jobs, args.rounds))
+        print(f"  {name:>8}: {elapsed:6.2f} s wall, loop lag p50 {np.percentile(lags, 50):7.1f} ms, "
+              f"p99 {np.percentile(lags, 99):7.1f} ms, max {lags.max():7.1f} ms")
+    asyncio.run_coroutine_threadsafe(api.stop(), api_loop).result()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# local stand-in for the video/song apis, used by tests/test_api_reqs.py and benchmarks.api_loop_lag
+import asyncio
+from aiohttp import web
+
+
+class MockAPI:
+    # every path answers from its script of (status, json) responses in order, repeating the last one
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.scripts = {}
+        self.hits = {}
+        self.runner = None
+        self.port = None
+
+    def script(self, path, *responses):
+        self.scripts[path] = list(responses)
+
+    async def handle(self, request):
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        responses = self.scripts.get(request.path, [(200, {})])
+        status, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        return web.json_response(body, status=status)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
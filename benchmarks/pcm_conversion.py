@@ -0,0 +1,72 @@
+# throughput of turning discord's 48 kHz stereo int16 into whisper's 16 kHz mono float32
+# compares pcm_to_float32 with the old path: write a wav, let faster-whisper decode and resample it with PyAV
+# run from the repo root: python -m benchmarks.pcm_conversion [--window-seconds 12] [--windows 50]
+import argparse
+import os
+import tempfile
+import time
+import wave
+import numpy as np
+from src.utils.audio import pcm_to_float32
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+
+
+def decode_with_av(path):
+    # what faster_whisper.decode_audio does, for when faster-whisper itself isn't installed
+    import av
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=16000)
+    frames = []
+    with av.open(path) as container:
+        for frame in container.decode(audio=0):
+            frames += [resampled.to_ndarray() for resampled in resampler.resample(frame)]
+        frames += [resampled.to_ndarray() for resampled in resampler.resample(None)]
+    return np.concatenate(frames, axis=None).astype(np.float32) / 32768.0
+
+def wav_round_trip(workdir):
+    try:
+        from faster_whisper import decode_audio
+    except ImportError:
+        decode_audio = decode_with_av
+    path = os.path.join(workdir, "chunked.wav")
+
+    def convert(pcm):
+        with wave.open(path, "wb") as f:
+            f.setnchannels(CHANNELS)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(pcm.tobytes())
+        return decode_audio(path)
+    return convert
+
+def in_memory(workdir):
+    return lambda pcm: pcm_to_float32(pcm, SAMPLE_RATE, CHANNELS)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window-seconds", type=float, default=12)
+    parser.add_argument("--windows", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pcm = rng.integers(-8000, 8000, int(args.window_seconds * SAMPLE_RATE) * CHANNELS, dtype=np.int16)
+    audio_seconds = args.window_seconds * args.windows
+    print(f"{args.windows} windows of {args.window_seconds:g} s, 48 kHz stereo int16 -> 16 kHz mono float32")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, make in (("wav + decode", wav_round_trip), ("pcm_to_float32", in_memory)):
+            try:
+                convert = make(workdir)
+                expected = len(convert(pcm))
+            except ImportError:
+                print(f"  {name:>14}: skipped, needs faster-whisper or av")
+                continue
+            start = time.perf_counter()
+            for _ in range(args.windows):
+                convert(pcm)
+            elapsed = time.perf_counter() - start
+            print(f"  {name:>14}: {elapsed / args.windows * 1000:6.1f} ms per window, {audio_seconds / elapsed:6.0f}x realtime, "
+                  f"{pcm.nbytes * args.windows / elapsed / 1e6:5.0f} MB/s in, {expected} samples out")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# wall time and peak rss of the ffmpeg render vs the moviepy fallback, on synthetic testsrc clips
+# needs ffmpeg and ffprobe on PATH (and moviepy for the fallback)
+# run from the repo root: python -m benchmarks.render_bench [--clips 6] [--clip-seconds 4] [--song-seconds 30]
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from src.utils import video_utils
+from config.constants import RENDER_WIDTH, RENDER_HEIGHT, RENDER_FPS, RENDER_PRESET
+
+ASS = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,48,&H00FFFFFF,&H0000FFFF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,2,10,10,40,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+{events}
+"""
+
+
+def make_inputs(workdir, clips, clip_seconds, song_seconds):
+    # clips look like normalize_clip output, so the concat demuxer can read them directly
+    clip_paths = []
+    for i in range(clips):
+        path = os.path.join(workdir, f"clip_{i + 1}.mp4")
+        subprocess.run([
+            "ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+            "-i", f"testsrc=size={RENDER_WIDTH}x{RENDER_HEIGHT}:rate={RENDER_FPS}:duration={clip_seconds}",
+            "-vf", "format=yuv420p", "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-an", path,
+        ], check=True)
+        clip_paths.append(path)
+    song_path = os.path.join(workdir, "song.mp3")
+    subprocess.run(["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={song_seconds}", song_path], check=True)
+    events = "\n".join(
+        f"Dialogue: 0,0:00:{s:02d}.00,0:00:{s + 2:02d}.00,Default,,0,0,0,,{{\\k100}}line {s // 2 + 1}"
+        for s in range(0, min(song_seconds, 58), 2)
+    )
+    ass_path = os.path.join(workdir, "lyrics.ass")
+    with open(ass_path, "w") as f:
+        f.write(ASS.format(width=RENDER_WIDTH, height=RENDER_HEIGHT, events=events))
+    return clip_paths, song_path, ass_path
+
+def render(engine, workdir):
+    # runs in its own python process so peak rss covers only this engine
+    with open(os.path.join(workdir, "inputs.json")) as f:
+        inputs = json.load(f)
+    output_path = os.path.join(workdir, f"output_{engine}.mp4")
+    start = time.perf_counter()
+    if engine == "ffmpeg":
+        ok = asyncio.run(video_utils.render_with_ffmpeg(inputs["song"], inputs["clips"], inputs["ass"], output_path))
+        if not ok:
+            raise SystemExit("ffmpeg render failed")
+    else:
+        video_utils.render_with_moviepy(inputs["song"], inputs["clips"], inputs["ass"], output_path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on linux, children covers the ffmpeg processes
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({"seconds": elapsed, "peak_rss_mb": peak_kb / 1024, "output_mb": os.path.getsize(output_path) / 1024 / 1024}))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=6)
+    parser.add_argument("--clip-seconds", type=int, default=4)
+    parser.add_argument("--song-seconds", type=int, default=30)
+    parser.add_argument("--engines", default="ffmpeg,moviepy")
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        render(args.engine, args.workdir)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        clips, song, ass = make_inputs(workdir, args.clips, args.clip_seconds, args.song_seconds)
+        with open(os.path.join(workdir, "inputs.json"), "w") as f:
+            json.dump({"clips": clips, "song": song, "ass": ass}, f)
+        print(f"{args.clips} x {args.clip_seconds} s testsrc clips looped over a {args.song_seconds} s song, "
+              f"{RENDER_WIDTH}x{RENDER_HEIGHT}@{RENDER_FPS}, preset {RENDER_PRESET}")
+        for engine in args.engines.split(","):
+            result = subprocess.run([sys.executable, "-m", "benchmarks.render_bench", "--engine", engine, "--workdir", workdir],
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"  {engine:>7}: failed\n{result.stderr.strip()[-500:]}")
+                continue
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"  {engine:>7}: {stats['seconds']:6.1f} s wall, peak rss {stats['peak_rss_mb']:6.0f} MB, output {stats['output_mb']:.1f} MB")
+
+if __name__ == "__main__":
+    main()
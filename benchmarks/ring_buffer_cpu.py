@@ -0,0 +1,82 @@
+# cpu seconds per minute of live audio spent buffering and windowing for whisper, old bytes buffer vs RingBuffer
+# the model call is left out, both paths hand it the same windows
+# run from the repo root: python -m benchmarks.ring_buffer_cpu [--minutes 2]
+import argparse
+import os
+import tempfile
+import time
+import wave
+import numpy as np
+from src.utils.audio import RingBuffer, pcm_to_float32
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+PACKET_FRAMES = 960  # discord sends 20 ms packets
+CHUNK_S, STREAM_CHUNK_S, STRIDE_S = 10, 3, 1  # the sink's window settings
+
+
+def packets(minutes, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(int(minutes * 60 * SAMPLE_RATE / PACKET_FRAMES)):
+        yield rng.integers(-3000, 3000, PACKET_FRAMES * CHANNELS, dtype=np.int16).tobytes()
+
+def write_wav(path, data):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(CHANNELS)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(data)
+
+def read_wav_as_float(path):
+    # stands in for the model loading chunked.wav: parse it, downmix and drop to 16 kHz
+    with wave.open(path, "rb") as f:
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    return samples.reshape(-1, CHANNELS).mean(axis=1)[::SAMPLE_RATE // 16000].astype(np.float32) / 32768.0
+
+def bytes_buffer(stream, workdir):
+    # what transcribe_audio_whisper did before: grow a bytes object, rewrite buffer.wav every packet, window through chunked.wav
+    bytes_per_s = SAMPLE_RATE * CHANNELS * 2
+    total = (2 * STRIDE_S + CHUNK_S) * bytes_per_s
+    buffer = b"\x00" * STRIDE_S * bytes_per_s
+    windows = 0
+    for data in stream:
+        buffer += data
+        write_wav(os.path.join(workdir, "buffer.wav"), buffer)
+        while len(buffer) >= total:
+            chunk = buffer[:total]
+            buffer = buffer[STREAM_CHUNK_S * bytes_per_s:]
+            write_wav(os.path.join(workdir, "chunked.wav"), chunk)
+            read_wav_as_float(os.path.join(workdir, "chunked.wav"))
+            windows += 1
+    return windows
+
+def ring_buffer(stream, workdir):
+    samples_per_s = SAMPLE_RATE * CHANNELS
+    total = (2 * STRIDE_S + CHUNK_S) * samples_per_s
+    buffer = RingBuffer(total * 2)
+    buffer.write(np.zeros(STRIDE_S * samples_per_s, dtype=np.int16))
+    windows = 0
+    for data in stream:
+        buffer.write(data)
+        while len(buffer) >= total:
+            pcm_to_float32(buffer.read(total), SAMPLE_RATE, CHANNELS)
+            buffer.advance(STREAM_CHUNK_S * samples_per_s)
+            windows += 1
+    return windows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=2)
+    args = parser.parse_args()
+
+    print(f"{args.minutes:g} min of 48 kHz stereo in 20 ms packets, 12 s windows every 3 s")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, strategy in (("bytes + wav", bytes_buffer), ("ring buffer", ring_buffer)):
+            stream = list(packets(args.minutes))
+            start_cpu, start_wall = time.process_time(), time.perf_counter()
+            windows = strategy(stream, workdir)
+            cpu, wall = time.process_time() - start_cpu, time.perf_counter() - start_wall
+            print(f"  {name:>11}: {cpu / args.minutes:7.2f} cpu s per audio minute ({wall:.1f} s wall, {windows} windows)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# fake video backend comparing the old 30 s polling pass with JobScheduler
+# run from the repo root: python -m benchmarks.scheduler_sim [--scenes 12] [--concurrency 3]
+import argparse
+import asyncio
+import random
+import time
+from src.utils import polling
+from src.utils.scheduler import JobScheduler, JobState
+from config.constants import MAX_CONCURRENT_VIDEOS, MAX_SCENES, VIDEO_TYPICAL_DURATION, VIDEO_MAX_RETRIES, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL
+
+SCALE = 0.002  # real seconds per simulated second, so a 4 minute video takes about half a second
+LEGACY_PASS_INTERVAL = 30  # simulated seconds between passes of the old loop
+
+
+class FakeVideoBackend:
+    # every (prompt, attempt) gets the same duration and outcome whichever strategy submits it
+    def __init__(self, seed=0, failure_rate=0.1, latency=0.5, min_duration=150, max_duration=330):
+        self.seed = seed
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.attempts = {}
+        self.jobs = {}  # job id -> (ready at, url or "" on failure)
+
+    async def submit(self, prompt):
+        await asyncio.sleep(self.latency * SCALE)
+        attempt = self.attempts[prompt] = self.attempts.get(prompt, 0) + 1
+        rng = random.Random(f"{self.seed}-{prompt}-{attempt}")
+        job_id = f"video-{len(self.jobs) + 1}"
+        duration = rng.uniform(self.min_duration, self.max_duration)
+        result = "" if rng.random() < self.failure_rate else f"https://fake.video/{job_id}.mp4"
+        self.jobs[job_id] = (time.monotonic() + duration * SCALE, result)
+        return job_id
+
+    async def status(self, job_id):
+        await asyncio.sleep(self.latency * SCALE)
+        ready_at, result = self.jobs[job_id]
+        return result if time.monotonic() >= ready_at else None
+
+    def submitted(self):
+        return len(self.jobs)
+
+async def run_legacy(backend, scenes, concurrency):
+    # the loop handle_video_generation used before the scheduler: top up slots, check every video in turn, sleep 30 s
+    video_ids = [None] * len(scenes)
+    video_urls = [None] * len(scenes)
+    in_progress = 0
+    next_index = 0
+    while None in video_urls:
+        while in_progress < concurrency and next_index < len(scenes):
+            video_ids[next_index] = await backend.submit(scenes[next_index])
+            in_progress += 1
+            next_index += 1
+        for i in range(len(scenes)):
+            if video_ids[i] and video_urls[i] is None:
+                video_url = await backend.status(video_ids[i])
+                if video_url is not None:
+                    video_urls[i] = video_url
+                    in_progress -= 1
+        await asyncio.sleep(LEGACY_PASS_INTERVAL * SCALE)
+    # failed videos were dropped
+    return [url for url in video_urls if url]
+
+async def run_scheduler(backend, scenes, concurrency):
+    scheduler = JobScheduler(
+        submit=lambda job: backend.submit(job.prompt),
+        check=backend.status,
+        concurrency=concurrency,
+        typical_duration=VIDEO_TYPICAL_DURATION * SCALE,
+        max_retries=VIDEO_MAX_RETRIES,
+    )
+    jobs = await scheduler.run(scenes)
+    return [job.result for job in jobs if job.state == JobState.DONE]
+
+def scale_polling():
+    # poll_interval reads these at call time, scale them with the backend's clock
+    polling.POLL_MIN_INTERVAL = POLL_MIN_INTERVAL * SCALE
+    polling.POLL_MAX_INTERVAL = POLL_MAX_INTERVAL * SCALE
+
+async def compare(scenes, concurrency, seed, failure_rate):
+    results = {}
+    for name, strategy in (("legacy", run_legacy), ("scheduler", run_scheduler)):
+        backend = FakeVideoBackend(seed, failure_rate)
+        start = time.monotonic()
+        urls = await strategy(backend, scenes, concurrency)
+        results[name] = {
+            "minutes": (time.monotonic() - start) / SCALE / 60,
+            "delivered": len(urls),
+            "submitted": backend.submitted(),
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenes", type=int, default=MAX_SCENES)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_VIDEOS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    scale_polling()
+    scenes = [f"scene {i + 1}" for i in range(args.scenes)]
+    print(f"{args.scenes} scenes, concurrency {args.concurrency}, failure rate {args.failure_rate:.0%}, simulated minutes")
+    totals = {"legacy": 0.0, "scheduler": 0.0}
+    for seed in range(args.runs):
+        results = asyncio.run(compare(scenes, args.concurrency, seed, args.failure_rate))
+        for name, result in results.items():
+            totals[name] += result["minutes"]
+            print(f"  seed {seed} {name:>9}: {result['minutes']:5.1f} min, {result['delivered']}/{args.scenes} videos, {result['submitted']} submitted")
+    print(f"mean legacy {totals['legacy'] / args.runs:.1f} min, scheduler {totals['scheduler'] / args.runs:.1f} min, "
+          f"{totals['legacy'] / totals['scheduler']:.2f}x")
+
+if __name__ == "__main__":
+    main()
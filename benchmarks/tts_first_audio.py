@@ -0,0 +1,119 @@
+# time to first audio for a tts reply, buffering the whole wav (the old synthesis path) vs TTSStreamSource
+# a local fake tts server streams a sine wave as fast as a model generating at --speed x realtime would
+# run from the repo root: python -m benchmarks.tts_first_audio [--seconds 8] [--speed 2] [--latency 0.3]
+import argparse
+import asyncio
+import struct
+import time
+import numpy as np
+from aiohttp import ClientTimeout, web
+from discord.opus import Encoder as OpusEncoder
+from benchmarks.mock_api import MockAPI
+from src.utils.api_reqs import close_session, get_session
+from src.utils.tts_stream import SILENT_FRAME, TTSStreamSource
+from config.constants import TTS_SAMPLE_RATE, TTS_READ_TIMEOUT
+
+FREQUENCY = 440
+CHUNK_SECONDS = 0.2  # audio the fake model produces per step
+FRAME_SECONDS = 0.02  # discord's player reads one frame this often
+
+
+def wav_header(sample_rate):
+    # streamed wavs don't know their length up front, the sizes are left at the maximum
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+def sine(start, count, sample_rate=TTS_SAMPLE_RATE):
+    t = (np.arange(count) + start) / sample_rate
+    return (np.sin(2 * np.pi * FREQUENCY * t) * 16000).astype(np.int16)
+
+class FakeTTS(MockAPI):
+    # answers every request with `seconds` of mono sine after `latency`, generated at `speed` x realtime
+    def __init__(self, seconds=8, speed=2, latency=0.3):
+        super().__init__()
+        self.seconds = seconds
+        self.speed = speed
+        self.latency = latency
+
+    async def handle(self, request):
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+        await request.read()
+        response = web.StreamResponse(headers={"content-type": "audio/wav"})
+        await response.prepare(request)
+        await asyncio.sleep(self.latency)
+        await response.write(wav_header(TTS_SAMPLE_RATE))
+        total = int(self.seconds * TTS_SAMPLE_RATE)
+        step = int(CHUNK_SECONDS * TTS_SAMPLE_RATE)
+        for start in range(0, total, step):
+            await asyncio.sleep(CHUNK_SECONDS / self.speed)
+            await response.write(sine(start, min(step, total - start)).tobytes())
+        await response.write_eof()
+        return response
+
+def play(source, started, result):
+    # stands in for discord's AudioPlayer thread, one read every 20 ms until the source ends
+    frames = []
+    next_read = time.monotonic()
+    while True:
+        frame = source.read()
+        if not frame:
+            break
+        if frame != SILENT_FRAME and "first_audio" not in result:
+            result["first_audio"] = time.monotonic() - started
+        frames.append(frame)
+        next_read += FRAME_SECONDS
+        time.sleep(max(0, next_read - time.monotonic()))
+    # silence after playback started means the stream fell behind the player
+    first = next(i for i, frame in enumerate(frames) if frame != SILENT_FRAME)
+    result["underruns"] = sum(frame == SILENT_FRAME for frame in frames[first:])
+    result["pcm"] = b"".join(frame for frame in frames if frame != SILENT_FRAME)
+
+async def post(url):
+    return await get_session().post(url, data=b"{}", timeout=ClientTimeout(total=None, sock_read=TTS_READ_TIMEOUT))
+
+async def buffered(url):
+    # old path: the whole body had to arrive before anything could be played
+    started = time.monotonic()
+    response = await post(url)
+    await response.read()
+    return {"first_audio": time.monotonic() - started}
+
+async def streamed(url):
+    started = time.monotonic()
+    response = await post(url)
+    source = TTSStreamSource()
+    source.loop = asyncio.get_running_loop()
+    source.feed_task = asyncio.create_task(source.feed(response, started))
+    result = {}
+    await asyncio.to_thread(play, source, started, result)
+    await source.feed_task
+    return result
+
+async def compare(seconds, speed, latency):
+    api = await FakeTTS(seconds, speed, latency).start()
+    try:
+        old = await buffered(api.url("/v1/tts"))
+        new = await streamed(api.url("/v1/tts"))
+    finally:
+        await close_session()
+        await api.stop()
+    return old, new
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=8)
+    parser.add_argument("--speed", type=float, default=2)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    old, new = asyncio.run(compare(args.seconds, args.speed, args.latency))
+    played = len(new["pcm"]) / (OpusEncoder.SAMPLING_RATE * OpusEncoder.CHANNELS * 2)
+    print(f"{args.seconds:g} s reply, tts at {args.speed:g}x realtime, {args.latency:g} s model latency")
+    print(f"  buffered wav:  first audio after {old['first_audio']:.2f} s")
+    print(f"  streamed:      first audio after {new['first_audio']:.2f} s, "
+          f"{new['underruns']} underrun frames, {played:.2f} s played")
+
+
+if __name__ == "__main__":
+    main()
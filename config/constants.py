@@ -4,15 +4,43 @@ Application constants and configuration values.
 
 # Discord Configuration
 DISCORD_CHANNEL_ID = 1298169696356536371
+CHAT_HISTORY_LIMIT = 100  # messages kept per channel for replies
+CHAT_CONTEXT_TOKEN_BUDGET = 3000  # approximate tokens of history sent with each reply
+CHAT_REPLY_DEBOUNCE = 3  # seconds of quiet before replying to a burst of messages
+CHAT_REPLY_MAX_DELAY = 10  # seconds a busy channel can hold off a reply before it is sent anyway
 
 # Video Generation Limits
 MAX_SCENES = 12
 MAX_CONCURRENT_VIDEOS = 3
+GLOBAL_VIDEO_CONCURRENCY = 6  # video jobs in flight across all generations
+GENERATION_WORKERS = 2  # generations running at once across all guilds
+MAX_QUEUED_PER_GUILD = 3  # queued + running generations allowed per guild
+RENDER_SLOTS = 1  # final renders running at once
+MEDIA_WORKERS = 2  # worker processes for moviepy renders and lyric alignment
+VIDEO_MAX_RETRIES = 2  # resubmissions per scene before it is dropped
+
+# Job Polling (seconds)
+POLL_MIN_INTERVAL = 5
+POLL_MAX_INTERVAL = 30
+POLL_BACKOFF = 0.1  # fraction of elapsed time added to the interval for long jobs
+VIDEO_TYPICAL_DURATION = 240  # typical time for a scene video to finish
+SONG_TYPICAL_DURATION = 90  # typical time for the suno song to finish
+VIDEO_MAX_WAIT = 1800  # a scene video still pending after this counts as failed and is resubmitted
+SONG_MAX_WAIT = 900  # a song still pending after this fails the generation
+PROGRESS_UPDATE_INTERVAL = 30
+PROGRESS_EDIT_MIN_INTERVAL = 5  # minimum seconds between edits of the same progress message
+PROGRESS_MESSAGE_POOL_SIZE = 32  # progress messages kept per generation
 
 # API Endpoints
 VIDEO_API_URL = "https://api.useapi.net/v1/minimax/videos/create"
 SONG_API_URL = "https://api.goapi.ai/api/suno/v1/music"
 
+# API Client
+API_CONNECTIONS_PER_HOST = 8
+API_TIMEOUT = 60  # seconds per request
+API_MAX_RETRIES = 3  # retries on 429/5xx and connection errors
+API_RETRY_BACKOFF = 1.0  # seconds, doubled every retry
+
 # Deepgram Configuration
 DEEPGRAM_MODEL = "nova-2"
 DEEPGRAM_OPTIONS = {
@@ -22,10 +50,66 @@ DEEPGRAM_OPTIONS = {
     "diarize": True,
     "detect_language": True
 }
+TRANSCRIPTION_CONCURRENCY = 4  # speakers transcribed at the same time
+
+# Whisper Models
+WHISPER_MODEL = "large-v3"  # faster-whisper model used by the live sinks
+ALIGNMENT_MODEL = "base"  # stable-whisper model used for lyric alignment
+WHISPER_DEVICE = "auto"  # "auto", "cuda" or "cpu"
+WHISPER_COMPUTE_TYPE = "auto"  # "auto" picks float16 on cuda and int8 on cpu
+MODEL_MEMORY_LIMIT_MB = None  # evict least recently used models past this resident size
+WARM_UP_MODELS = [("stable-whisper", ALIGNMENT_MODEL), ("faster-whisper", WHISPER_MODEL)]  # loaded when the bot starts
+
+# LLM Cache
+LLM_CACHE_ENABLED = True
+LLM_CACHE_DIR = "./.llm_cache"
+LLM_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+LLM_CACHE_MAX_MB = 50
+
+# Live Recording
+CLIP_MIN_DURATION = 1  # seconds, shorter utterances are kept in the clip with the next one
+CLIP_MAX_DURATION = 15  # seconds, a clip is cut here even if the speaker hasn't paused
+CLIP_TRANSCRIPTION_QUEUE_SIZE = 16  # finished clips waiting for transcription before new ones are skipped
+WRITER_BACKLOG_WARN = 100  # packets (20 ms each) still queued after a flush before the writer is reported as behind
+WRITER_FLUSH_WARN = 0.1  # seconds, a flush slower than this is reported
+TRANSCRIPTION_BATCH_SIZE = 4  # windows from different speakers transcribed in one model call
+TRANSCRIPTION_BATCH_WAIT = 0.25  # seconds to wait for more windows before running a batch
+VOICE_TRANSCRIPT_TOKEN_BUDGET = 2000  # approximate tokens of settled live transcript kept between replies
+VOICE_HISTORY_TOKEN_BUDGET = 4000  # approximate tokens of voice chat history sent with each reply
+
+# Voice Activity Detection
+VAD_ENABLED = True
+VAD_ENERGY_THRESHOLD = 300  # int16 rms below this counts as silence
+VAD_HANGOVER = 0.3  # seconds of silence kept after speech so word endings aren't clipped
+
+# Text to Speech
+TTS_API_URL = "http://127.0.0.1:8080/v1/tts"
+TTS_SAMPLE_RATE = 44100  # mono int16 pcm from the local tts server
+TTS_CHUNK_SIZE = 4096  # bytes read from the tts stream at a time
+TTS_READ_TIMEOUT = 30  # seconds without new audio before the stream is abandoned
 
 # File Paths
 COMPRESSED_OUTPUT_PATH = "./compressed_output.mp4"
 CLIENT_SECRET_FILE = "client_secret.json"
+GENERATION_STATE_DIR = "./generations"  # per-generation checkpoints and working files
+
+# Downloads
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes held in memory per download
+DOWNLOAD_READ_TIMEOUT = 60  # seconds without data before a download is abandoned
+DOWNLOAD_MAX_RETRIES = 3  # retries per file on a dropped connection, timeout or 5xx
+DOWNLOAD_RETRY_BACKOFF = 2  # seconds, doubled after every retry
 
 # Video Processing
-VIDEO_COMPRESSION_QUALITY = 50 
\ No newline at end of file
+RENDER_WIDTH = 1280
+RENDER_HEIGHT = 720
+RENDER_FPS = 25
+RENDER_ENGINE = "ffmpeg"  # "ffmpeg" or "moviepy"
+RENDER_CODEC = "libx265"
+RENDER_PRESET = "medium"
+RENDER_THREADS = 0  # 0 lets the encoder pick
+VIDEO_COMPRESSION_QUALITY = 50  # target size in MB for the discord upload
+COMPRESSION_CODEC = "libx264"
+COMPRESSION_AUDIO_BITRATE = 128  # kbps
+COMPRESSION_OVERHEAD = 0.03  # fraction of the size budget reserved for container overhead
+COMPRESSION_TWO_PASS = True
+ 
\ No newline at end of file
@@ -1,35 +1,76 @@
 import asyncio
 import io
+import os
 import re
 import discord
 from dotenv import load_dotenv
 from os import environ as env
 
-import requests
 from src.manager import GenerationManager
-from src.utils.api_reqs import create_video_request_with_image, get_video_status, post_image
+from src.utils.api_reqs import create_video_request_with_image, download_bytes, get_video_status, post_image
 from src.utils.plot import generate_image_prompt, generate_message_reply
 from src.utils.synthesis import synthesize_and_stream_audio
 from src.utils.sinks import RealTimeTranscriptionSink
-from config.constants import DISCORD_CHANNEL_ID
+from src.utils.models import get_model, registry
+from src.utils.chat_context import contexts, get_context
+from src.utils.checkpoint import is_generation_id
+from src.utils.generation_queue import GenerationQueue
+from config.constants import DISCORD_CHANNEL_ID, GENERATION_STATE_DIR, WARM_UP_MODELS, WHISPER_MODEL
 
 CHANNEL_ID = DISCORD_CHANNEL_ID
 
 class BotManager:
     def __init__(self):
         self.connections = {}
-        self.generation_in_progress = False  # Track if generation is in progress bot-wide
+        # generations from every guild share a worker pool instead of one at a time bot-wide
+        self.generation_queue = GenerationQueue()
+        # ids queued or running, two managers on one id would share its checkpoint and paid jobs
+        self.active_generations = set()
         self.image_queue = []
 
     async def once_done(self, sink: discord.sinks, channel: discord.TextChannel, *args):
         await sink.vc.disconnect()
         generation_manager = GenerationManager(channel, sink)
-        
-        # Start the video generation process
-        await generation_manager.generate_video()
-        
-        # Mark that the generation is complete
-        self.generation_in_progress = False
+        await self.queue_generation(generation_manager, channel)
+
+    async def queue_generation(self, generation_manager, channel):
+        async def on_start():
+            await channel.send("ok its ur turn, working on it")
+
+        self.active_generations.add(generation_manager.generation_id)
+        position = self.generation_queue.submit(channel.guild.id, lambda: self.run_generation(generation_manager, channel), on_start)
+        if position is None:
+            self.active_generations.discard(generation_manager.generation_id)
+            await channel.send("this server already has too many videos cooking")
+        elif position > 0:
+            await channel.send(f"ur #{position} in line")
+
+    async def run_generation(self, generation_manager, channel):
+        try:
+            # Start the video generation process
+            await generation_manager.generate_video()
+        except Exception as e:
+            print(f"Generation {generation_manager.generation_id} failed: {e}")
+            await channel.send(f"it broke, /resume {generation_manager.generation_id} to pick up where it left off")
+        finally:
+            self.active_generations.discard(generation_manager.generation_id)
+
+    async def resume(self, ctx, generation_id):
+        # the id is user input, only ever turn it into a path once it looks like one we handed out
+        if not is_generation_id(generation_id) or not os.path.exists(os.path.join(GENERATION_STATE_DIR, generation_id, "state.json")):
+            await ctx.respond("never heard of that one")
+            return
+        if generation_id in self.active_generations:
+            await ctx.respond("already on it")
+            return
+        # claimed before the first await so a second /resume for the same id sees it
+        self.active_generations.add(generation_id)
+        try:
+            await ctx.respond("picking it back up")
+        except Exception:
+            self.active_generations.discard(generation_id)
+            raise
+        await self.queue_generation(GenerationManager(ctx.channel, None, generation_id), ctx.channel)
     
     async def imitate(self, ctx):
         # if already in a vc, don't connect again
@@ -41,11 +82,13 @@ class BotManager:
             await ctx.respond("hop in vc")
             return
 
+        # normally warmed up in on_ready, loaded off the loop in case it isn't yet
+        model = await asyncio.to_thread(get_model, "faster-whisper", WHISPER_MODEL)
         vc = await voice.channel.connect()
         self.connections.update({ctx.guild.id: vc})
         async def when_done(sink: discord.sinks, channel: discord.TextChannel, *args):
             await vc.disconnect()
-        sink = RealTimeTranscriptionSink(transcription_method='deepgram')
+        sink = RealTimeTranscriptionSink(model, transcription_method='deepgram')
         vc.start_recording(sink, when_done, ctx)
 
     async def add_image_to_queue(self, original_message, prompt_message):
@@ -68,10 +111,13 @@ class BotManager:
     async def check_video_status(self, video_id, message):  
         while True:
             video_url = await get_video_status(video_id)
+            if video_url == "":
+                await message.channel.send("that one didnt work", reference=message)
+                self.image_queue.remove(message)
+                break
             if video_url:
                 # download the video
-                video_response = requests.get(video_url)
-                video_content = io.BytesIO(video_response.content)
+                video_content = io.BytesIO(await download_bytes(video_url))
                 video_content.seek(0)
                 video_file = discord.File(video_content, filename=f"{video_id}.mp4")
                 await message.channel.send(file=video_file, reference=message)
@@ -80,9 +126,9 @@ class BotManager:
             await asyncio.sleep(10)
 
     async def record(self, ctx):
-        # if generation is in progress, don't start another one
-        if self.generation_in_progress:
-            await ctx.respond("already working on a generation")
+        # if already recording in this server, don't start another one
+        if ctx.guild.id in self.connections:
+            await ctx.respond("already recording")
             return
 
         voice = ctx.author.voice
@@ -93,10 +139,6 @@ class BotManager:
 
         vc = await voice.channel.connect()
         self.connections.update({ctx.guild.id: vc})
-        
-        # Set generation in progress bot-wide
-        self.generation_in_progress = True
-        
         await self.record_audio(vc, ctx)
 
     async def record_audio(self, vc, ctx):
@@ -113,8 +155,6 @@ class BotManager:
             vc = self.connections[ctx.guild.id]
             vc.stop_recording()
             del self.connections[ctx.guild.id]
-            # Reset the generation in progress flag bot-wide
-            self.generation_in_progress = False
         else:
             await ctx.respond("ur high bruh")
 
@@ -133,22 +173,47 @@ async def record(ctx):
 async def stop_recording(ctx):
     await bot_manager.stop_recording(ctx)
 
+@bot.command()
+async def resume(ctx, generation_id: str):
+    await bot_manager.resume(ctx, generation_id)
+
 @bot.command()
 async def imitate(ctx):
     await bot_manager.imitate(ctx)
 
+@bot.event
+async def on_ready():
+    # load the whisper models up front so the first generation doesn't pay for it
+    if WARM_UP_MODELS:
+        await asyncio.to_thread(registry.warm_up, WARM_UP_MODELS)
+    # seed the reply context once instead of fetching history on every message
+    channel = bot.get_channel(CHANNEL_ID)
+    if channel:
+        await get_context(CHANNEL_ID).seed(channel)
+
+@bot.event
+async def on_message_edit(before, after):
+    if after.channel.id in contexts:
+        contexts[after.channel.id].edit(after)
+
+@bot.event
+async def on_message_delete(message):
+    if message.channel.id in contexts:
+        contexts[message.channel.id].delete(message.id)
+
 @bot.event
 async def on_message(message):
-    if message.channel.id == CHANNEL_ID and not message.author.bot:
-        # Create a placeholder message that mirrors the original message
-        # get the last messages for the day as context in the channel
-        messages = await message.channel.history(limit=100).flatten()
-        # output them as a string and reverse order
-        messages_string = "\n".join([f"{m.author.display_name}: {m.content}" for m in messages[::-1]])
-        print(messages_string)
-        mirrored_message = await generate_message_reply(messages_string)
-        if mirrored_message != "":
-            await message.channel.send(mirrored_message)
+    if message.channel.id == CHANNEL_ID:
+        # keep the bot's own replies in the context too
+        context = get_context(message.channel.id)
+        context.add(message)
+        if not message.author.bot:
+            async def reply(messages_string):
+                print(messages_string)
+                mirrored_message = await generate_message_reply(messages_string)
+                if mirrored_message != "":
+                    await message.channel.send(mirrored_message)
+            context.schedule_reply(reply)
 
     # if mentioned
     if bot.user.mentioned_in(message):
@@ -4,13 +4,17 @@ import discord
 import os
 from deepgram import DeepgramClient, PrerecordedOptions
 
-from src.utils.api_reqs import check_song_status, check_video_status, create_song_request, create_video_request
-from src.utils.funny import update_progress_message
+from src.utils.api_reqs import check_song_status, create_song_request, create_video_request, get_session, get_video_status
+from src.utils.checkpoint import Checkpoint
+from src.utils.funny import ProgressMessagePool, edit_message, update_progress_message
+from src.utils.llm_cache import cache_stats
 from src.utils.plot import PlotManager
+from src.utils.polling import poll_until
+from src.utils.scheduler import JobScheduler, JobState
 from src.utils.transcript import replace_usernames, transcribe_audio, BOOST_WORDS
-from src.utils.video_utils import compress_video, merge_videos_and_song
+from src.utils.video_utils import align_lyrics_to_file, compress_video, download_file, load_alignment, merge_videos_and_song, normalize_clip, write_subtitles
 from src.utils.youtube import YouTubeUploader
-from config.constants import MAX_SCENES, MAX_CONCURRENT_VIDEOS, DEEPGRAM_MODEL, DEEPGRAM_OPTIONS, COMPRESSED_OUTPUT_PATH, CLIENT_SECRET_FILE, VIDEO_COMPRESSION_QUALITY
+from config.constants import MAX_SCENES, MAX_CONCURRENT_VIDEOS, VIDEO_TYPICAL_DURATION, VIDEO_MAX_RETRIES, VIDEO_MAX_WAIT, SONG_TYPICAL_DURATION, SONG_MAX_WAIT, PROGRESS_UPDATE_INTERVAL, GLOBAL_VIDEO_CONCURRENCY, RENDER_SLOTS, DEEPGRAM_MODEL, DEEPGRAM_OPTIONS, COMPRESSED_OUTPUT_PATH, CLIENT_SECRET_FILE, VIDEO_COMPRESSION_QUALITY
 
 deepgram = DeepgramClient(os.getenv("DEEPGRAM_API_TOKEN"))
 options = PrerecordedOptions(
@@ -19,11 +23,28 @@ options = PrerecordedOptions(
     **DEEPGRAM_OPTIONS
 )
 
+async def cancel_tasks(tasks):
+    # cancel and wait, so nothing keeps polling or holding a slot after a generation fails
+    tasks = [task for task in tasks if task is not None and not task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+# caps shared by every generation running at once
+video_slots = asyncio.Semaphore(GLOBAL_VIDEO_CONCURRENCY)
+render_slots = asyncio.Semaphore(RENDER_SLOTS)
+
 class GenerationManager:
-    def __init__(self, channel, sink):
+    def __init__(self, channel, sink, generation_id=None):
         self.plot_manager = PlotManager()
         self.channel = channel
         self.sink = sink
+        # passing the id of a failed generation resumes it from its last completed stage
+        self.checkpoint = Checkpoint(generation_id)
+        self.generation_id = self.checkpoint.generation_id
+        self.clip_tasks = {}
+        self.youtube_data_task = None
+        self.progress_messages = ProgressMessagePool()
 
     async def generate_transcript(self, sink):
         words_list = await transcribe_audio(sink, deepgram, options)
@@ -39,75 +60,198 @@ class GenerationManager:
         return replace_usernames(transcript.strip())
 
     async def generate_video(self):
+        checkpoint = self.checkpoint
+        if checkpoint.resumed:
+            print(f"Resuming generation {self.generation_id}")
+
         # step 1: extract transcript information from the audio
-        transcript = await self.generate_transcript(self.sink)
+        transcript = checkpoint.get("transcript")
+        if transcript is None:
+            transcript = await self.generate_transcript(self.sink)
+            checkpoint.set("transcript", transcript)
         print("Transcript:", transcript)
 
-        # step 2: generate lyrics and scenes from the transcript
-        tags, lyrics, scenes = await self.plot_manager.generate_lyrics_and_scenes(transcript, MAX_SCENES)
+        # step 2: generate lyrics from the transcript, scenes are streamed in step 3
+        if checkpoint.get("lyrics") is None:
+            tags, lyrics = await self.plot_manager.generate_lyrics(transcript)
+            checkpoint.set("tags", tags)
+            checkpoint.set("lyrics", lyrics)
+        tags, lyrics = checkpoint.get("tags"), checkpoint.get("lyrics")
+        self.plot_manager.tags, self.plot_manager.lyrics = tags, lyrics
         print("Tags:", tags)
         print("Lyrics:", lyrics)
-        for i, scene in enumerate(scenes):
-            print(f"Scene {i+1}: {scene}")
 
         # step 3: generate a song and videos from the lyrics and scenes
-        song_task_id = create_song_request(lyrics, tags)
-        video_urls, song_url = await self.handle_video_generation(scenes, song_task_id)
-        subtitle_properties = await self.plot_manager.generate_subtitles(lyrics)
+        # subtitle styling, youtube metadata and progress messages only need the lyrics/scenes,
+        # so they run alongside song and video generation
+        subtitle_task = asyncio.create_task(self.plot_manager.generate_subtitles(lyrics))
+        try:
+            song_task_id = checkpoint.get("song_task_id")
+            if song_task_id is None:
+                song_task_id = await create_song_request(lyrics, tags)
+                if not song_task_id:
+                    raise RuntimeError("Song request was not accepted")
+                checkpoint.set("song_task_id", song_task_id)
+            video_paths, song_path, alignment = await self.handle_video_generation(transcript, lyrics, song_task_id)
+            ass_path = write_subtitles(alignment, await subtitle_task, ass_path=checkpoint.path("output.ass"))
+        except BaseException:
+            await cancel_tasks([subtitle_task, self.youtube_data_task])
+            raise
 
         # step 4: merge videos and send final output
-        output_path = await merge_videos_and_song(song_url, lyrics, video_urls, subtitle_properties)
-        # create compressed version to send
-        compress_video(output_path, COMPRESSED_OUTPUT_PATH, VIDEO_COMPRESSION_QUALITY)
-        await self.channel.send(file=discord.File(COMPRESSED_OUTPUT_PATH))
+        # the compressed version to send is rendered in the same pass as the full resolution one
+        if not checkpoint.has_file("output_path"):
+            # kept per generation since several generations can render at once
+            compressed_output_path = checkpoint.path(os.path.basename(COMPRESSED_OUTPUT_PATH))
+            render_message = await self.channel.send("rendering...")
+            async with render_slots:
+                output_path = await merge_videos_and_song(song_path, video_paths, ass_path, compressed_output_path, VIDEO_COMPRESSION_QUALITY, output_path=checkpoint.path("final_output_with_subtitles.mp4"), on_progress=lambda progress: self.report_render_progress(render_message, progress))
+            checkpoint.set("compressed_output_path", compressed_output_path)
+            checkpoint.set("output_path", output_path)
+        output_path = checkpoint.get("output_path")
+
+        # posting is its own stage, a send that failed is retried on resume instead of skipped
+        if not checkpoint.get("discord_posted"):
+            if not checkpoint.has_file("compressed_output_path"):
+                compressed_output_path = checkpoint.path(os.path.basename(COMPRESSED_OUTPUT_PATH))
+                await compress_video(output_path, compressed_output_path, VIDEO_COMPRESSION_QUALITY)
+                checkpoint.set("compressed_output_path", compressed_output_path)
+            await self.channel.send(file=discord.File(checkpoint.get("compressed_output_path")))
+            checkpoint.set("discord_posted", True)
 
         # upload full resolution version to youtube
-        youtube_data = await self.plot_manager.generate_youtube_data()
-        print("Youtube Data:", youtube_data)
-        youtube_uploader = YouTubeUploader(client_secret_file=CLIENT_SECRET_FILE)
-        link = youtube_uploader.upload_video(output_path, youtube_data=youtube_data)
-        await self.channel.send(link)
+        if checkpoint.get("youtube_link") is None:
+            youtube_data = await self.youtube_data_task
+            print("Youtube Data:", youtube_data)
+            # auth and upload are blocking google api calls, keep them off the loop
+            link = await asyncio.to_thread(lambda: YouTubeUploader(client_secret_file=CLIENT_SECRET_FILE).upload_video(output_path, youtube_data=youtube_data))
+            checkpoint.set("youtube_link", link)
+            await self.channel.send(link)
 
-    async def handle_video_generation(self, scenes, song_task_id):
+        # everything is posted, the clips, song and renders are only taking up disk now
+        checkpoint.remove()
+        print("LLM cache:", cache_stats())
+
+    async def handle_video_generation(self, transcript, lyrics, song_task_id):
         initial_message = await self.channel.send("im thinking so hard rn")
-        video_ids = [None] * MAX_SCENES
-        video_urls = [None] * MAX_SCENES
-        in_progress_videos = 0
-        next_video_index = 0
-        song_url = None
+        checkpoint = self.checkpoint
+        scheduler = JobScheduler(
+            submit=self.submit_scene,
+            check=get_video_status,
+            concurrency=MAX_CONCURRENT_VIDEOS,
+            typical_duration=VIDEO_TYPICAL_DURATION,
+            max_retries=VIDEO_MAX_RETRIES,
+            max_wait=VIDEO_MAX_WAIT,
+            on_complete=self.on_video_complete,
+            shared_semaphore=video_slots,
+        )
 
         start_time = time.time()
-        total_vids = len(scenes)
-
-        while None in video_urls or song_url is None:
-            # Start new video requests
-            while in_progress_videos < MAX_CONCURRENT_VIDEOS and next_video_index < MAX_SCENES:
-                scene = scenes[next_video_index]
-                video_id = await create_video_request(scene, next_video_index + 1)
-                video_ids[next_video_index] = video_id
-                in_progress_videos += 1
-                next_video_index += 1
-
-            # Check the status of the song
-            song_url = await check_song_status(song_task_id, song_url)
-
-            # Check the status of video requests
-            video_urls, in_progress_videos = await check_video_status(video_ids, video_urls, in_progress_videos)
-
-            # Calculate progress
-            completed_videos = len([url for url in video_urls if url is not None])
-            progress_percent = (completed_videos / total_vids) * 100 if total_vids > 0 else 0
-
-            # Estimate time remaining based on elapsed time and progress
-            elapsed_time = time.time() - start_time
-            if progress_percent > 0:
-                estimated_total_time = elapsed_time / (progress_percent / 100)
-                remaining_time = estimated_total_time - elapsed_time
+        scenes = []
+        scenes_done = False
+
+        async def song_worker():
+            if checkpoint.has_file("song_path") and checkpoint.has_file("alignment_path"):
+                return checkpoint.get("song_path"), load_alignment(checkpoint.get("alignment_path"))
+            song_url = await poll_until(lambda: check_song_status(song_task_id), SONG_TYPICAL_DURATION, max_wait=SONG_MAX_WAIT)
+            if not song_url:
+                # failed upstream or never finished, the scenes' video jobs are cancelled with it
+                raise RuntimeError(f"Song {song_task_id} failed or timed out")
+            song_path = await download_file(get_session(), song_url, checkpoint.path('song.mp3'))
+            if song_path is None:
+                raise RuntimeError(f"Song {song_task_id} could not be downloaded")
+            checkpoint.set("song_path", song_path)
+            # align lyrics while the remaining scenes are still generating, in a thread so it uses the
+            # registry's warmed up model instead of loading another copy in a worker process
+            alignment_path = await asyncio.to_thread(align_lyrics_to_file, song_path, lyrics, checkpoint.path("alignment.json"))
+            checkpoint.set("alignment_path", alignment_path)
+            return song_path, load_alignment(alignment_path)
+
+        async def report_progress():
+            while True:
+                # Calculate progress
+                completed_videos = scheduler.count(JobState.DONE, JobState.FAILED)
+                total_vids = len(scenes) if scenes_done else MAX_SCENES
+                progress_percent = (completed_videos / total_vids) * 100 if total_vids > 0 else 0
+
+                # Estimate time remaining based on elapsed time and progress
+                elapsed_time = time.time() - start_time
+                if progress_percent > 0:
+                    estimated_total_time = elapsed_time / (progress_percent / 100)
+                    remaining_time = estimated_total_time - elapsed_time
+                else:
+                    remaining_time = -1
+                await update_progress_message(initial_message, remaining_time, custom_messages=self.progress_messages.get())
+                await asyncio.sleep(PROGRESS_UPDATE_INTERVAL)
+
+        progress_task = asyncio.create_task(report_progress())
+        song_task = asyncio.create_task(song_worker())
+        try:
+            if checkpoint.get("scenes_done"):
+                scene_source = self.saved_scenes()
             else:
-                remaining_time = -1
-            progress_messages = await self.plot_manager.generate_progress_messages(''.join(scenes))
-            await update_progress_message(initial_message, remaining_time, custom_messages=progress_messages)
-            await asyncio.sleep(30)
+                scene_source = self.plot_manager.stream_scenes(transcript, lyrics, MAX_SCENES)
+            # submit each scene's video as soon as it has streamed in
+            async for scene in scene_source:
+                print(f"Scene {len(scenes) + 1}: {scene}")
+                index = str(len(scenes))
+                scenes.append(scene)
+                scheduler.add(scene, job_id=checkpoint.get("video_ids", {}).get(index), result=checkpoint.get("video_urls", {}).get(index))
+            scenes_done = True
+            checkpoint.set("scenes", scenes)
+            checkpoint.set("scenes_done", True)
+            self.plot_manager.scenes = scenes
+            self.youtube_data_task = asyncio.create_task(self.plot_manager.generate_youtube_data())
+            self.progress_messages.fill(lambda: self.plot_manager.generate_progress_messages(''.join(scenes)))
+            jobs = await scheduler.join()
+            song_path, alignment = await song_task
+            # clips were downloaded and normalized as each scene finished, most are already on disk
+            video_paths = await asyncio.gather(*(self.clip_tasks[job.index] for job in jobs if job.index in self.clip_tasks))
+        except BaseException:
+            # a failed scene stream or clip would otherwise leave jobs polling forever on the shared video slots,
+            # and a later /resume would poll the same job ids a second time
+            await scheduler.cancel()
+            await cancel_tasks([song_task, *self.clip_tasks.values()])
+            raise
+        finally:
+            progress_task.cancel()
+            self.progress_messages.close()
+
+        video_paths = [path for path in video_paths if path is not None]
+        return video_paths, song_path, alignment
+
+    def report_render_progress(self, render_message, progress):
+        # called from the ffmpeg progress reader, edits are rate limited so this can fire often
+        async def edit():
+            if await edit_message(render_message, f"rendering {int(progress * 100)}%"):
+                print(f"Render {int(progress * 100)}%")
+        asyncio.create_task(edit())
+
+    async def saved_scenes(self):
+        for scene in self.checkpoint.get("scenes"):
+            yield scene
+
+    async def submit_scene(self, job):
+        video_id = await create_video_request(job.prompt, job.index + 1)
+        if video_id:
+            self.checkpoint.update("video_ids", job.index, video_id)
+        return video_id
+
+    async def on_video_complete(self, job):
+        print(f"Scene {job.index + 1} {job.state.value} after {job.attempts} attempt(s)")
+        if job.state == JobState.DONE:
+            self.checkpoint.update("video_urls", job.index, job.result)
+            self.clip_tasks[job.index] = asyncio.create_task(self.prepare_clip(job))
 
-        video_urls = [url for url in video_urls if url is not ""]
-        return video_urls, song_url
\ No newline at end of file
+    async def prepare_clip(self, job):
+        clip_path = self.checkpoint.get("clips", {}).get(str(job.index))
+        if clip_path and os.path.exists(clip_path):
+            return clip_path
+        video_path = await download_file(get_session(), job.result, self.checkpoint.path(f'video_{job.index + 1}.mp4'))
+        if video_path is None:
+            # still failing after retries, dropped like a clip that fails to normalize
+            return None
+        clip_path = await normalize_clip(video_path, self.checkpoint.path(f'video_{job.index + 1}_normalized.mp4'))
+        if clip_path:
+            self.checkpoint.update("clips", job.index, clip_path)
+        return clip_path
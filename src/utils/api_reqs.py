@@ -1,15 +1,40 @@
-import requests
+import asyncio
 import json
 import os
-from config.constants import VIDEO_API_URL, SONG_API_URL
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientError, ClientConnectorError
+from config.constants import VIDEO_API_URL, SONG_API_URL, API_CONNECTIONS_PER_HOST, API_TIMEOUT, API_MAX_RETRIES, API_RETRY_BACKOFF
 
 VIDEO_API_TOKEN = os.getenv("VIDEO_API_TOKEN")
 VIDEO_API_ACCOUNT = os.getenv("VIDEO_API_ACCOUNT")
 SONG_API_TOKEN = os.getenv("GHETTO_API_TOKEN")
 
+# statuses worth retrying: rate limited or upstream hiccup
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# a post that timed out or 5xx'd may still have created a paid job upstream, only retry what certainly wasn't accepted
+UNSAFE_RETRY_STATUSES = {429}
+
+_session = None
+
+def get_session():
+    # one pooled session per process so every api call reuses keep-alive connections
+    global _session
+    if _session is None or _session.closed:
+        connector = TCPConnector(limit_per_host=API_CONNECTIONS_PER_HOST, keepalive_timeout=30)
+        _session = ClientSession(connector=connector, timeout=ClientTimeout(total=API_TIMEOUT))
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 async def check_song_status(song_task_id, song_url=None):
-    if song_task_id and song_url is None:
-        song_info = create_request(
+    # returns the audio url once completed, "" if the task failed or has no id, None while pending
+    if not song_task_id:
+        return ""
+    if song_url is None:
+        song_info = await create_request(
             f"https://api.goapi.ai/api/v1/task/{song_task_id}",
             {
                 "x-api-key": SONG_API_TOKEN,
@@ -23,46 +48,58 @@ async def check_song_status(song_task_id, song_url=None):
             clips = song_info["data"]["output"].get("clips")
             if clips:
                 song_url = list(clips.values())[0].get("audio_url")
+            if not song_url:
+                return ""
+        elif song_info and song_info["data"]["status"] == "Failed":
+            return ""
     return song_url
 
-async def get_video_status(video_id): 
-    video_info = create_request(f"https://api.useapi.net/v1/minimax/videos/{video_id}", {
+async def get_video_status(video_id):
+    # returns the download url once completed, "" if the job failed, None while pending
+    video_info = await create_request(f"https://api.useapi.net/v1/minimax/videos/{video_id}", {
         "Authorization": f"Bearer {VIDEO_API_TOKEN}",
         "Content-Type": "application/json"
     }, method="get")
     if video_info:
         if video_info["status"] == 2:  # Completed
             return video_info["downloadURL"]
+        elif video_info["status"] > 2:  # Failed
+            return ""
     return None
 
-async def check_video_status(video_ids, video_urls, in_progress_videos):
-    for i in range(len(video_ids)):
-        if video_ids[i] and video_urls[i] is None:
-            video_info = create_request(f"https://api.useapi.net/v1/minimax/videos/{video_ids[i]}", {
-                "Authorization": f"Bearer {VIDEO_API_TOKEN}",
-                "Content-Type": "application/json"
-            }, method="get")
-            if video_info:
-                if video_info["status"] == 2:  # Completed
-                    video_urls[i] = video_info["downloadURL"]
-                    in_progress_videos -= 1
-                elif video_info["status"] > 2: # Failed
-                    video_urls[i] = ""
-                    in_progress_videos -= 1
-    return video_urls, in_progress_videos
+async def create_request(url, headers, body=None, params=None, method="post", idempotent=None):
+    # gets retry on any transient failure, posts only on 429 or when the connection never opened unless idempotent=True
+    if idempotent is None:
+        idempotent = method != "post"
+    retry_statuses = RETRY_STATUSES if idempotent else UNSAFE_RETRY_STATUSES
+    if method == "post" and isinstance(body, dict):
+        body = json.dumps(body)
+    session = get_session()
+    for attempt in range(API_MAX_RETRIES + 1):
+        try:
+            async with session.request(method.upper(), url, headers=headers, data=body, params=params) as response:
+                if response.status == 200:
+                    return await response.json(content_type=None)
+                text = await response.text()
+                if response.status not in retry_statuses or attempt == API_MAX_RETRIES:
+                    print(f"Error with request to {url}: {response.status}, {text}")
+                    return None
+                # honour Retry-After on 429 if the api gives us one
+                retry_after = response.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else API_RETRY_BACKOFF * 2 ** attempt
+        except (ClientError, asyncio.TimeoutError) as e:
+            if attempt == API_MAX_RETRIES or not (idempotent or isinstance(e, ClientConnectorError)):
+                print(f"Error with request to {url}: {e}")
+                return None
+            delay = API_RETRY_BACKOFF * 2 ** attempt
+        print(f"Retrying request to {url} in {delay:.1f}s (attempt {attempt + 1}/{API_MAX_RETRIES})")
+        await asyncio.sleep(delay)
 
-def create_request(url, headers, body=None, params=None, method="post"):
-    if method == "post":
-        if isinstance(body, dict):
-            body = json.dumps(body)
-        response = requests.post(url, headers=headers, data=body)
-    elif method == "get":
-        response = requests.get(url, headers=headers, params=params)
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error with request to {url}: {response.status_code}, {response.text}")
+async def download_bytes(url):
+    async with get_session().get(url) as response:
+        if response.status == 200:
+            return await response.read()
+        print(f"Error downloading {url}: {response.status}")
         return None
 
 async def create_video_request(scene_prompt, scene_number):
@@ -75,7 +112,8 @@ async def create_video_request(scene_prompt, scene_number):
         "promptOptimization": True,
         "maxJobs": 5
     }
-    return create_request(VIDEO_API_URL, headers, body=body).get("videoId")
+    response = await create_request(VIDEO_API_URL, headers, body=body)
+    return response.get("videoId") if response else None
 
 async def create_video_request_with_image(context, file_id):
     headers = {
@@ -88,19 +126,18 @@ async def create_video_request_with_image(context, file_id):
         "maxJobs": 5,
         "fileID": file_id
     }
-    return create_request(VIDEO_API_URL, headers, body=body).get("videoId")
+    return (await create_request(VIDEO_API_URL, headers, body=body)).get("videoId")
 
 async def post_image(image_url, content_type):
-    response_image = requests.get(image_url)
-    file_content = response_image.content
+    file_content = await download_bytes(image_url)
     url = f"https://api.useapi.net/v1/minimax/files/?account={VIDEO_API_ACCOUNT}"
     headers = {
         "Authorization": f"Bearer {VIDEO_API_TOKEN}",
         "Content-Type": content_type
     }
-    return create_request(url, headers, method="post", body=file_content).get("fileID")
+    return (await create_request(url, headers, method="post", body=file_content)).get("fileID")
 
-def create_song_request(lyrics=None, tags=None, mode="custom", instrumental=False):
+async def create_song_request(lyrics=None, tags=None, mode="custom", instrumental=False):
     headers = {
         "x-api-key": SONG_API_TOKEN,
         "Content-Type": "application/json"
@@ -129,5 +166,5 @@ def create_song_request(lyrics=None, tags=None, mode="custom", instrumental=Fals
             }
         }
 
-    response = create_request("https://api.goapi.ai/api/v1/task", headers, body=body)
-    return response.get("data", {}).get("task_id")
\ No newline at end of file
+    response = await create_request("https://api.goapi.ai/api/v1/task", headers, body=body)
+    return response.get("data", {}).get("task_id") if response else None
\ No newline at end of file
@@ -0,0 +1,167 @@
+import numpy as np
+from config.constants import VAD_ENERGY_THRESHOLD, VAD_HANGOVER
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+class RingBuffer:
+    # preallocated int16 ring for live pcm, so appending a packet is one copy instead of regrowing a bytes object
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def write(self, data):
+        # accepts raw pcm bytes or an int16 array, overwriting the oldest samples once full
+        samples = np.frombuffer(data, dtype=np.int16) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        if len(samples) >= self.capacity:
+            samples = samples[-self.capacity:]
+        end = (self.start + self.size) % self.capacity
+        first = min(len(samples), self.capacity - end)
+        self.buffer[end:end + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        overflow = max(0, self.size + len(samples) - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.size = min(self.capacity, self.size + len(samples))
+
+    def read(self, n):
+        # the oldest n samples as a contiguous array, only copies when the window wraps around
+        n = min(n, self.size)
+        end = self.start + n
+        if end <= self.capacity:
+            return self.buffer[self.start:end]
+        return np.concatenate((self.buffer[self.start:], self.buffer[:end - self.capacity]))
+
+    def advance(self, n):
+        n = min(n, self.size)
+        self.start = (self.start + n) % self.capacity
+        self.size -= n
+
+_lowpass_cache = {}
+
+def lowpass_taps(factor, num_taps=63):
+    # windowed-sinc low-pass at the output nyquist so decimating doesn't alias
+    if factor not in _lowpass_cache:
+        cutoff = 0.5 / factor
+        n = np.arange(num_taps) - (num_taps - 1) / 2
+        taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(num_taps)
+        _lowpass_cache[factor] = (taps / taps.sum()).astype(np.float32)
+    return _lowpass_cache[factor]
+
+def polyphase_taps(factor):
+    # the reversed low-pass taps zero padded to a multiple of factor, one row per group of `factor` input samples
+    taps = lowpass_taps(factor)
+    groups = -(-len(taps) // factor)
+    phases = np.zeros(groups * factor, dtype=np.float32)
+    phases[:len(taps)] = taps[::-1]
+    return taps, phases.reshape(groups, factor)
+
+def pcm_to_float32(pcm, sample_rate, channels):
+    # interleaved int16 pcm (bytes or array) to the 16 kHz mono float32 array whisper takes directly
+    samples = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+    samples = samples[:len(samples) // channels * channels]
+    # downmix by adding strided channels, much cheaper than a mean over a (frames, channels) reshape
+    audio = samples[0::channels].astype(np.float32)
+    for channel in range(1, channels):
+        audio += samples[channel::channels]
+    audio *= 1.0 / (channels * 32768.0)
+    if sample_rate == WHISPER_SAMPLE_RATE:
+        return audio
+    if sample_rate % WHISPER_SAMPLE_RATE == 0:
+        # discord's 48 kHz is an integer multiple, filter then keep every nth sample
+        factor = sample_rate // WHISPER_SAMPLE_RATE
+        taps, phases = polyphase_taps(factor)
+        # polyphase: with the signal in rows of `factor` samples, each kept sample is a sum of
+        # row . tap-group products, so only the kept samples are filtered and nothing strided is copied
+        n = (len(audio) - 1) // factor + 1
+        padded = np.zeros((n + len(phases)) * factor, dtype=np.float32)
+        padded[len(taps) // 2:len(taps) // 2 + len(audio)] = audio
+        rows = padded.reshape(-1, factor)
+        out = rows[:n] @ phases[0]
+        for j in range(1, len(phases)):
+            out += rows[j:j + n] @ phases[j]
+        return out
+    positions = np.arange(0, len(audio), sample_rate / WHISPER_SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+class StreamResampler:
+    # resamples int16 pcm chunk by chunk, carrying the tail between chunks so boundaries don't click
+    def __init__(self, in_rate, out_rate, out_channels=1):
+        self.step = in_rate / out_rate
+        self.out_channels = out_channels
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.consumed = 0  # absolute input index of pending[0]
+        self.produced = 0  # output samples so far, positions come from this so rounding never drifts
+        self.leftover = b""
+
+    def process(self, pcm):
+        # mono int16 bytes in, int16 bytes at out_rate (duplicated to out_channels) out
+        pcm = self.leftover + pcm
+        usable = len(pcm) // 2 * 2
+        self.leftover = pcm[usable:]
+        x = np.concatenate((self.pending, np.frombuffer(pcm[:usable], dtype=np.int16).astype(np.float32)))
+        if len(x) < 2:
+            self.pending = x
+            return b""
+        # every output sample whose input position has a right neighbour to interpolate with
+        last = self.consumed + len(x) - 1
+        n = max(0, int(np.ceil(last / self.step)) - self.produced)
+        positions = (self.produced + np.arange(n)) * self.step - self.consumed
+        out = np.interp(positions, np.arange(len(x)), x)
+        self.produced += n
+        drop = min(int(self.produced * self.step) - self.consumed, len(x) - 1)
+        self.pending = x[drop:]
+        self.consumed += drop
+        out = np.clip(np.round(out), -32768, 32767).astype(np.int16)
+        if self.out_channels > 1:
+            out = np.repeat(out, self.out_channels)
+        return out.tobytes()
+
+def rms(samples):
+    if len(samples) == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+
+class EnergyVAD:
+    # default detector, anything with an is_speech(samples) method can be passed to SpeechGate instead
+    def __init__(self, threshold=VAD_ENERGY_THRESHOLD):
+        self.threshold = threshold
+
+    def is_speech(self, samples):
+        return rms(samples) >= self.threshold
+
+class SpeechGate:
+    # per-speaker gate: passes speech plus a short hangover, drops silence and reports each finished utterance
+    def __init__(self, sample_rate, channels, vad=None, hangover_s=VAD_HANGOVER, on_utterance=None):
+        self.samples_per_second = sample_rate * channels
+        self.vad = vad or EnergyVAD()
+        self.hangover_samples = int(self.samples_per_second * hangover_s)
+        self.on_utterance = on_utterance
+        self.silent_samples = self.hangover_samples + 1
+        self.in_utterance = False
+        self.utterance_samples = 0
+        self.dropped_samples = 0
+
+    def process(self, data):
+        # returns the packet if it should be kept, None if it is silence
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.vad.is_speech(samples):
+            self.silent_samples = 0
+            self.in_utterance = True
+        else:
+            self.silent_samples += len(samples)
+
+        if self.silent_samples > self.hangover_samples:
+            if self.in_utterance:
+                self.in_utterance = False
+                if self.on_utterance:
+                    self.on_utterance(self.utterance_samples / self.samples_per_second)
+                self.utterance_samples = 0
+            self.dropped_samples += len(samples)
+            return None
+        self.utterance_samples += len(samples)
+        return data
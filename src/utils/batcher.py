@@ -0,0 +1,94 @@
+import asyncio
+import numpy as np
+from config.constants import TRANSCRIPTION_BATCH_SIZE, TRANSCRIPTION_BATCH_WAIT
+
+
+# set once the batched path has failed, e.g. a faster-whisper whose internals moved, so it isn't retried every batch
+batching_failed = False
+
+def transcribe_one(model, audio, language="en", beam_size=5):
+    segments, _ = model.transcribe(audio, language=language, beam_size=beam_size, without_timestamps=True)
+    return "".join(segment.text for segment in segments)
+
+def transcribe_batch(model, audios, language="en", beam_size=5):
+    # one encoder and one decoder call for every window in the batch, each window fits in whisper's 30 s input
+    # built on faster-whisper internals, tests/test_batcher.py runs it against the version pinned in requirements.txt
+    global batching_failed
+    if len(audios) == 1 or batching_failed:
+        return transcribe_each(model, audios, language, beam_size)
+    try:
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import get_ctranslate2_storage
+        tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+        n_frames = model.feature_extractor.nb_max_frames
+        features = []
+        for audio in audios:
+            feature = model.feature_extractor(audio)[:, :n_frames]
+            features.append(np.pad(feature, ((0, 0), (0, n_frames - feature.shape[-1]))))
+        # WhisperModel.encode adds a batch axis for its single window, so the stacked batch goes to ctranslate2 directly
+        to_cpu = model.model.device == "cuda" and len(model.model.device_index) > 1
+        encoder_output = model.model.encode(get_ctranslate2_storage(np.stack(features)), to_cpu=to_cpu)
+        prompt = list(tokenizer.sot_sequence) + [tokenizer.no_timestamps]
+        results = model.model.generate(encoder_output, [prompt] * len(audios), beam_size=beam_size, max_length=model.max_length)
+        return [tokenizer.decode(result.sequences_ids[0]).strip() for result in results]
+    except Exception as e:
+        # any other faster-whisper version can break the pieces above, fall back to one call per window
+        print(f"Batched transcription failed, transcribing windows one at a time from now on: {e!r}")
+        batching_failed = True
+        return transcribe_each(model, audios, language, beam_size)
+
+def transcribe_each(model, audios, language="en", beam_size=5):
+    # one result per window, a window that fails gets its exception instead of failing the rest
+    results = []
+    for audio in audios:
+        try:
+            results.append(transcribe_one(model, audio, language, beam_size))
+        except Exception as e:
+            results.append(e)
+    return results
+
+class TranscriptionBatcher:
+    # collects ready windows from every speaker for up to max_wait seconds and transcribes them as one batch
+    def __init__(self, model, loop, max_batch_size=TRANSCRIPTION_BATCH_SIZE, max_wait=TRANSCRIPTION_BATCH_WAIT):
+        self.model = model
+        self.loop = loop
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.task = loop.create_task(self.run())
+
+    async def transcribe(self, audio):
+        # audio is a 16 kHz mono float32 array, returns its text once its batch has run
+        future = self.loop.create_future()
+        self.queue.put_nowait((audio, future))
+        return await future
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                texts = await asyncio.to_thread(transcribe_batch, self.model, [audio for audio, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), text in zip(batch, texts):
+                if future.done():
+                    continue
+                if isinstance(text, Exception):
+                    future.set_exception(text)
+                else:
+                    future.set_result(text)
+
+    def stop(self):
+        self.task.cancel()
@@ -0,0 +1,87 @@
+import asyncio
+from collections import deque
+from config.constants import CHAT_HISTORY_LIMIT, CHAT_CONTEXT_TOKEN_BUDGET, CHAT_REPLY_DEBOUNCE, CHAT_REPLY_MAX_DELAY
+
+
+def estimate_tokens(text):
+    # rough ~4 characters per token, close enough for trimming context
+    return len(text) // 4 + 1
+
+class ChannelContext:
+    # rolling chat history for one channel, fed by gateway events instead of re-fetching history per message
+    def __init__(self, max_messages=CHAT_HISTORY_LIMIT):
+        self.messages = deque(maxlen=max_messages)  # (message id, "name: content"), oldest first
+        self.seeded = False
+        self.reply_task = None
+        self.pending_since = None  # when the burst waiting for a reply started, None once the reply is underway
+
+    async def seed(self, channel):
+        if self.seeded:
+            return
+        self.seeded = True
+        history = await channel.history(limit=self.messages.maxlen).flatten()
+        known_ids = {message_id for message_id, _ in self.messages}
+        # history comes newest first, so prepending in order keeps the deque oldest first
+        for m in history:
+            if m.id not in known_ids and len(self.messages) < self.messages.maxlen:
+                self.messages.appendleft((m.id, f"{m.author.display_name}: {m.content}"))
+
+    def add(self, message):
+        self.messages.append((message.id, f"{message.author.display_name}: {message.content}"))
+
+    def edit(self, message):
+        for i, (message_id, _) in enumerate(self.messages):
+            if message_id == message.id:
+                self.messages[i] = (message.id, f"{message.author.display_name}: {message.content}")
+                return
+
+    def delete(self, message_id):
+        for entry in self.messages:
+            if entry[0] == message_id:
+                self.messages.remove(entry)
+                return
+
+    def render(self, token_budget=CHAT_CONTEXT_TOKEN_BUDGET):
+        # keep the newest messages that fit in the budget
+        lines = []
+        for _, line in reversed(self.messages):
+            token_budget -= estimate_tokens(line)
+            if token_budget < 0:
+                break
+            lines.append(line)
+        return "\n".join(reversed(lines))
+
+    def schedule_reply(self, reply, delay=CHAT_REPLY_DEBOUNCE, max_delay=CHAT_REPLY_MAX_DELAY):
+        # a burst of messages coalesces into one reply once the channel has been quiet for `delay` seconds,
+        # or after `max_delay` if it never goes quiet
+        now = asyncio.get_running_loop().time()
+        if self.pending_since is not None:
+            # still sleeping, a reply that already started is left to finish
+            self.reply_task.cancel()
+        else:
+            self.pending_since = now
+        delay = min(delay, max(0, self.pending_since + max_delay - now))
+
+        async def debounced():
+            await asyncio.sleep(delay)
+            self.pending_since = None
+            await reply(self.render())
+
+        self.reply_task = asyncio.create_task(debounced())
+
+contexts = {}
+
+def get_context(channel_id):
+    if channel_id not in contexts:
+        contexts[channel_id] = ChannelContext()
+    return contexts[channel_id]
+
+def trim_history(messages, token_budget):
+    # sliding window over chat completion messages, newest kept, always at least the last one
+    kept = []
+    for message in reversed(messages):
+        token_budget -= estimate_tokens(message["content"])
+        if token_budget < 0 and kept:
+            break
+        kept.append(message)
+    return kept[::-1]
@@ -0,0 +1,57 @@
+import json
+import os
+import re
+import shutil
+import time
+from config.constants import GENERATION_STATE_DIR
+
+# ids are millisecond timestamps, anything else never came from Checkpoint
+GENERATION_ID_PATTERN = re.compile(r"[0-9]{13}")
+
+def is_generation_id(value):
+    return GENERATION_ID_PATTERN.fullmatch(value) is not None
+
+class Checkpoint:
+    # per-generation state directory, every completed stage is written to state.json so a failed run can resume
+    def __init__(self, generation_id=None, root=GENERATION_STATE_DIR):
+        self.generation_id = generation_id or str(int(time.time() * 1000))
+        self.directory = os.path.join(root, self.generation_id)
+        self.resumed = os.path.exists(self.state_path())
+        os.makedirs(self.directory, exist_ok=True)
+        self.state = {}
+        if self.resumed:
+            with open(self.state_path()) as f:
+                self.state = json.load(f)
+
+    def state_path(self):
+        return os.path.join(self.directory, "state.json")
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def set(self, key, value):
+        self.state[key] = value
+        self.save()
+
+    def update(self, key, field, value):
+        # set one field of a dict stage, e.g. a single scene's video id
+        self.state.setdefault(key, {})[str(field)] = value
+        self.save()
+
+    def has_file(self, key):
+        path = self.state.get(key)
+        return path is not None and os.path.exists(path)
+
+    def remove(self):
+        # drop the state and every working file once the generation is finished
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save(self):
+        # write then rename so a crash mid-write never leaves a corrupt state file
+        temp_path = self.state_path() + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_path, self.state_path())
@@ -1,7 +1,27 @@
+import asyncio
 import random
+import time
+from collections import OrderedDict, deque
+from config.constants import PROGRESS_EDIT_MIN_INTERVAL, PROGRESS_MESSAGE_POOL_SIZE
 
+# message id -> time of the last edit, capped so it can't grow across generations
+_last_edits = OrderedDict()
+_MAX_TRACKED_MESSAGES = 64
 
-async def update_progress_message(initial_message, remaining_time, custom_messages=None):
+
+async def edit_message(message, content, min_interval=PROGRESS_EDIT_MIN_INTERVAL):
+    # skip the edit if this message was edited too recently, to stay clear of discord's edit rate limits
+    last_edit = _last_edits.get(message.id)
+    if last_edit is not None and time.time() - last_edit < min_interval:
+        return False
+    _last_edits[message.id] = time.time()
+    _last_edits.move_to_end(message.id)
+    while len(_last_edits) > _MAX_TRACKED_MESSAGES:
+        _last_edits.popitem(last=False)
+    await message.edit(content=content)
+    return True
+
+async def update_progress_message(initial_message, remaining_time, custom_messages=None, min_interval=PROGRESS_EDIT_MIN_INTERVAL):
     if custom_messages is None:
         thinking_text = random.choice(["thinking", "thinking hard", "thinking so hard rn", "this is taking a while", "doin stuff", "lol", "bruh"])
     else:
@@ -12,4 +32,28 @@ async def update_progress_message(initial_message, remaining_time, custom_messag
     minutes, seconds = divmod(remaining_time, 60)
     time_left_msg = f"{int(minutes)} min {int(seconds)} sec remaining" if remaining_time != -1 else "calculating..."
 
-    await initial_message.edit(content=f"{thinking_text}\n{song_generated_text}{video_generated_text}\n{time_left_msg} til imma bus")
\ No newline at end of file
+    return await edit_message(initial_message, f"{thinking_text}\n{song_generated_text}{video_generated_text}\n{time_left_msg} til imma bus", min_interval)
+
+class ProgressMessagePool:
+    # progress messages for one generation, generated once in the background and reused for every update
+    def __init__(self, max_size=PROGRESS_MESSAGE_POOL_SIZE):
+        self.messages = deque(maxlen=max_size)
+        self.task = None
+
+    def fill(self, generate):
+        async def fill():
+            try:
+                self.messages.extend(message for message in await generate() if message.strip())
+            except Exception as e:
+                print(f"Failed to generate progress messages: {e}")
+        if self.task is None:
+            self.task = asyncio.create_task(fill())
+
+    def get(self):
+        # None until the pool lands, so update_progress_message falls back to its default messages
+        return list(self.messages) or None
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+        self.messages.clear()
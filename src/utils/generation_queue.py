@@ -0,0 +1,84 @@
+import asyncio
+from collections import OrderedDict, deque
+from config.constants import GENERATION_WORKERS, MAX_QUEUED_PER_GUILD
+
+
+class GenerationQueue:
+    # runs generations from every guild on a fixed pool of workers, taking turns between guilds
+    def __init__(self, workers=GENERATION_WORKERS, max_per_guild=MAX_QUEUED_PER_GUILD):
+        self.workers = workers
+        self.max_per_guild = max_per_guild
+        self.guild_queues = OrderedDict()  # guild id -> deque of (run, on_start), rotated for round robin
+        self.running = {}  # guild id -> generations currently running
+        self.wake = asyncio.Event()
+        self.worker_tasks = []
+
+    def next_guild(self, queues, running):
+        # the guild with the fewest generations running goes next, ties broken by who has waited longest
+        waiting = [guild_id for guild_id, queue in queues.items() if queue]
+        if not waiting:
+            return None
+        return min(waiting, key=lambda guild_id: running.get(guild_id, 0))
+
+    def order(self):
+        # the order queued generations will start in, replaying pop without anything finishing
+        queues = OrderedDict((guild_id, deque(queue)) for guild_id, queue in self.guild_queues.items())
+        running = dict(self.running)
+        order = []
+        while True:
+            guild_id = self.next_guild(queues, running)
+            if guild_id is None:
+                return order
+            order.append(queues[guild_id].popleft())
+            queues.move_to_end(guild_id)
+            running[guild_id] = running.get(guild_id, 0) + 1
+
+    def submit(self, guild_id, run, on_start=None):
+        # returns how many places back in line it is, 0 if a worker is free, or None if the guild already has too much queued
+        queue = self.guild_queues.setdefault(guild_id, deque())
+        if len(queue) + self.running.get(guild_id, 0) >= self.max_per_guild:
+            return None
+        if not queue:
+            # a guild that had nothing waiting joins at the back instead of keeping its old spot
+            self.guild_queues.move_to_end(guild_id)
+        entry = (run, on_start)
+        queue.append(entry)
+        if not self.worker_tasks:
+            self.worker_tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        self.wake.set()
+        free_workers = self.workers - sum(self.running.values())
+        return max(0, self.order().index(entry) + 1 - free_workers)
+
+    def pop(self):
+        guild_id = self.next_guild(self.guild_queues, self.running)
+        if guild_id is None:
+            return None, None
+        entry = self.guild_queues[guild_id].popleft()
+        # this guild goes to the back of the line for the next free worker
+        self.guild_queues.move_to_end(guild_id)
+        return guild_id, entry
+
+    async def worker(self):
+        while True:
+            guild_id, entry = self.pop()
+            if entry is None:
+                self.wake.clear()
+                await self.wake.wait()
+                continue
+            run, on_start = entry
+            self.running[guild_id] = self.running.get(guild_id, 0) + 1
+            try:
+                if on_start:
+                    await on_start()
+                await run()
+            except Exception as e:
+                print(f"Generation for guild {guild_id} failed: {e}")
+            finally:
+                self.running[guild_id] -= 1
+                if not self.running[guild_id]:
+                    del self.running[guild_id]
+                if guild_id in self.guild_queues and not self.guild_queues[guild_id]:
+                    del self.guild_queues[guild_id]
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.guild_queues.values())
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import time
+from config.constants import LLM_CACHE_ENABLED, LLM_CACHE_DIR, LLM_CACHE_TTL, LLM_CACHE_MAX_MB
+
+
+class LLMCache:
+    # content-addressed on-disk cache for deterministic-enough completions, keyed by the full request
+    def __init__(self, directory=LLM_CACHE_DIR, ttl=LLM_CACHE_TTL, max_size_mb=LLM_CACHE_MAX_MB):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.stats = {"hits": 0, "misses": 0, "saved_tokens": 0, "saved_seconds": 0.0}
+
+    def key(self, request):
+        # model, messages and sampling params all end up in the request, so they all change the key
+        encoded = json.dumps(request, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) > self.ttl:
+            self.stats["misses"] += 1
+            return None
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            content = entry["content"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # an unreadable entry is a miss, dropped so the next set rewrites it
+            print(f"Dropping unreadable cache entry {path}: {e!r}")
+            if os.path.exists(path):
+                os.remove(path)
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.stats["saved_tokens"] += entry.get("tokens", 0)
+        self.stats["saved_seconds"] += entry.get("latency", 0)
+        return content
+
+    def set(self, key, content, tokens=0, latency=0):
+        os.makedirs(self.directory, exist_ok=True)
+        # write then rename so a crash mid-write never leaves a truncated entry
+        temp_path = self.path(key) + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"content": content, "tokens": tokens, "latency": latency}, f)
+        os.replace(temp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        # drop expired entries, then the oldest ones until the store fits in max_size_mb
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl:
+                os.remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            os.remove(path)
+            total_size -= size
+
+llm_cache = LLMCache()
+
+async def cached_completion(client, use_cache=True, **request):
+    # returns the message content, use_cache=False bypasses the cache for creative high temperature calls
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    if use_cache:
+        key = llm_cache.key(request)
+        content = llm_cache.get(key)
+        if content is not None:
+            return content
+    start_time = time.time()
+    response = await client.chat.completions.create(**request)
+    content = response.choices[0].message.content
+    if use_cache:
+        tokens = response.usage.total_tokens if response.usage else 0
+        llm_cache.set(key, content, tokens=tokens, latency=time.time() - start_time)
+    return content
+
+def cache_stats():
+    return dict(llm_cache.stats)
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+import psutil
+from config.constants import WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, MODEL_MEMORY_LIMIT_MB
+
+
+def resident_mb():
+    # current rss, unlike getrusage's peak it drops again when an evicted model is freed
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+def resolve_device():
+    if WHISPER_DEVICE != "auto":
+        return WHISPER_DEVICE
+    try:
+        import ctranslate2
+        return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    except ImportError:
+        return "cpu"
+
+def resolve_compute_type(device):
+    if WHISPER_COMPUTE_TYPE != "auto":
+        return WHISPER_COMPUTE_TYPE
+    return "float16" if device == "cuda" else "int8"
+
+def load_faster_whisper(name, device, compute_type):
+    from faster_whisper import WhisperModel
+    return WhisperModel(name, device=device, compute_type=compute_type)
+
+def load_stable_whisper(name, device, compute_type):
+    import stable_whisper
+    return stable_whisper.load_model(name, device=device)
+
+LOADERS = {
+    "faster-whisper": load_faster_whisper,
+    "stable-whisper": load_stable_whisper,
+}
+
+class ModelRegistry:
+    # loads each model lazily, once per process, and shares it between sinks and generations
+    def __init__(self, memory_limit_mb=MODEL_MEMORY_LIMIT_MB):
+        self.memory_limit_mb = memory_limit_mb
+        self.models = OrderedDict()  # (kind, name) -> model, least recently used first
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get(self, kind, name):
+        key = (kind, name)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                self.metrics[key]["uses"] += 1
+                return self.models[key]
+
+            device = resolve_device()
+            compute_type = resolve_compute_type(device)
+            start_time = time.time()
+            rss_before = resident_mb()
+            model = LOADERS[kind](name, device, compute_type)
+            rss_after = resident_mb()
+            self.models[key] = model
+            self.metrics[key] = {
+                "device": device,
+                "compute_type": compute_type,
+                "load_time": time.time() - start_time,
+                "resident_mb": rss_after - rss_before,
+                "uses": 1,
+            }
+            print(f"Loaded {kind} {name} on {device} ({compute_type}) in {self.metrics[key]['load_time']:.1f}s, "
+                  f"{self.metrics[key]['resident_mb']:.0f} MB resident")
+            self.evict(keep=key)
+            return model
+
+    def evict(self, keep=None):
+        # drop least recently used models once their combined size goes over the limit
+        if self.memory_limit_mb is None:
+            return
+        while self.resident_total() > self.memory_limit_mb and len(self.models) > 1:
+            key = next(k for k in self.models if k != keep)
+            print(f"Evicting {key[0]} {key[1]}")
+            del self.models[key]
+            self.metrics[key]["resident_mb"] = 0
+
+    def resident_total(self):
+        return sum(self.metrics[key]["resident_mb"] for key in self.models)
+
+    def warm_up(self, models):
+        for kind, name in models:
+            self.get(kind, name)
+        for model, metrics in model_metrics().items():
+            print(f"Model {model}: {metrics}")
+
+registry = ModelRegistry()
+
+def get_model(kind, name):
+    return registry.get(kind, name)
+
+def model_metrics():
+    return {f"{kind}:{name}": dict(metrics, loaded=(kind, name) in registry.models) for (kind, name), metrics in registry.metrics.items()}
@@ -1,11 +1,16 @@
 import json
 import openai
 import os
+import re
+from src.utils.llm_cache import cached_completion
 
-client = openai.OpenAI(
+client = openai.AsyncOpenAI(
     api_key=os.getenv("OPENAI_API_KEY")
 )
 
+# a scene starts at a numbered marker, "Scene 3:", not at any mention of the word
+SCENE_MARKER = re.compile(r"Scene (?=\d)")
+
 class PlotManager:
     def __init__(self):
         self.client = client
@@ -16,6 +21,11 @@ class PlotManager:
         return tags, lyrics
 
     async def generate_lyrics_and_scenes(self, transcript, num_scenes):
+        tags, lyrics = await self.generate_lyrics(transcript)
+        scenes = await self.generate_scenes(transcript, lyrics, num_scenes)
+        return tags, lyrics, scenes
+
+    async def generate_lyrics(self, transcript):
         prompt = r"""
         You are a creative writer, named BlinkBot, tasked with turning a discord call transcript between friends into a narrative for a short music video. Create a set of lyrics and 6 scene prompts, depending on the content of the transcript and quality of story, for a text-to-video model. 
         1. Tags for the song genre and style
@@ -27,7 +37,7 @@ class PlotManager:
         Lyrics: [lyrics]
         Visual Theme: [visual theme sentences]
         """
-        video_completion = self.client.chat.completions.create(
+        video_completion = await self.client.chat.completions.create(
             model="gpt-4o",
             max_tokens=4095,
             messages=[
@@ -36,13 +46,15 @@ class PlotManager:
         ],
         )
         tags, lyrics = self.parse_lyrics_and_scenes(video_completion.choices[0].message.content)
-        scenes = await self.generate_scenes(transcript, lyrics, num_scenes)
         self.tags = tags
         self.lyrics = lyrics
-        self.scenes = scenes
-        return tags, lyrics, scenes
+        return tags, lyrics
 
     async def generate_scenes(self, transcript, lyrics, num_scenes):
+        return [scene async for scene in self.stream_scenes(transcript, lyrics, num_scenes)]
+
+    async def stream_scenes(self, transcript, lyrics, num_scenes):
+        # yields each scene as soon as the next one starts streaming in, so its video can be submitted right away
         scenes_prompt = rf"""
         Create a series of {num_scenes} detailed scene prompts for a music video, using a transcript and lyrics as a basis. Each prompt should stand alone, vividly describing only the visual elements of the scene. The scenes should creatively reflect the story conveyed in the transcript and use elements from the lyrics, especially the chorus, to guide the visual narrative. 
 
@@ -76,19 +88,38 @@ class PlotManager:
         - Ensure that each character's description is repeated fully for consistency, regardless of the scene number.
         - Balance creativity with narrative coherence, ensuring the story visually flows with the music.
         """
-        scenes_prompt_completion = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model="gpt-4o",
             max_tokens=4095,
             messages=[
                 {"role": "system", "content": scenes_prompt},
                 {"role": "user", "content": f"{transcript}\n\nLyrics: {lyrics}"},
             ],
+            stream=True,
             )
-        scenes = scenes_prompt_completion.choices[0].message.content.split("Scene ")[1:]
-        return scenes
+        self.scenes = []
+        buffer = ""
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            buffer += chunk.choices[0].delta.content
+            # a scene is everything between two numbered "Scene " markers
+            parts = SCENE_MARKER.split(buffer)
+            for scene in parts[1:-1]:
+                self.scenes.append(scene)
+                yield scene
+                # every scene becomes a paid video job, never more than asked for
+                if len(self.scenes) >= num_scenes:
+                    await stream.close()
+                    return
+            buffer = buffer if len(parts) <= 2 else "Scene " + parts[-1]
+        parts = SCENE_MARKER.split(buffer)
+        for scene in parts[1:num_scenes - len(self.scenes) + 1]:
+            self.scenes.append(scene)
+            yield scene
     
     async def generate_youtube_data(self):
-        response = client.chat.completions.create(
+        content = await cached_completion(client,
         model="gpt-4o-mini",
         messages=[
             {
@@ -146,10 +177,10 @@ class PlotManager:
                 }
             }
         )
-        return json.loads(response.choices[0].message.content)
+        return json.loads(content)
 
     async def generate_subtitles(self, lyrics):
-        response = client.chat.completions.create(
+        content = await cached_completion(client,
         model="gpt-4o-mini",
         messages=[
             {
@@ -197,10 +228,10 @@ class PlotManager:
             }
         }
         )
-        return json.loads(response.choices[0].message.content)
+        return json.loads(content)
     
     async def generate_progress_messages(self, lyrics):
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Generate a series of progress messages for a music video, based on the lyrics and scene descriptions. Make each message a short sentence, which only vaguely/indirectly hints at the content of the video. Format your answer by putting one message per line. Use slang/casual style, as a discord user, and all lowercase."},
@@ -211,7 +242,7 @@ class PlotManager:
 
 async def generate_message_reply(original_message):
     completion_prompt = "continue the discord chat. Only reference/reply to people who are in the current chat's context, don't @ or message people, just refer to them by name. logically continue the conversation when asked of you, and don't post links that aren't valid, especially youtube links"
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="ft:gpt-4o-mini-2024-07-18:fearsha-inc:blink-general:AL2SSCiJ",
         messages=[{"role": "system", "content": completion_prompt}, {"role": "user", "content": original_message}],
         temperature=0.7,
@@ -221,7 +252,7 @@ async def generate_message_reply(original_message):
 
 async def generate_voice_response(transcript_history):
     completion_prompt = "continue the voice chat, which is labeled by user ids in a discord call. Try to be friendly, and respond to the user in a conversational manner. If you don't know what to say, just say something short like \"ok\" or \"uh huh\" or \"yeah\" or something similar.\n Reply as BlinkBot: , not as Speaker"
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role": "system", "content": completion_prompt}, *transcript_history],
         temperature=0.7,
@@ -234,11 +265,12 @@ async def generate_voice_response(transcript_history):
 async def generate_image_prompt(context):
     # generate a prompt for an image based on the context
     prompt = "generate a prompt for an image based on the context, from a discord chat. If not enough context is provided, make up a short story to base the image on, and be as radical and weird as possible, not being afraid to display gore, violence, or other disturbing content. Example: a man starts eating burgers relentlessly, and starts getting fatter and larger until he explodes"
-    response = client.chat.completions.create(
+    # a fresh image every time, even for the same chat context
+    content = await cached_completion(client, use_cache=False,
         model="gpt-4o-mini",
         messages=[{"role": "system", "content": prompt}, {"role": "user", "content": context}],
         temperature=1,
         max_tokens=1024
     )
-    return response.choices[0].message.content
+    return content
 
@@ -0,0 +1,25 @@
+import asyncio
+import time
+from config.constants import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF
+
+
+def poll_interval(elapsed, typical_duration):
+    # poll tightly around the typical completion time so finished jobs are picked up fast
+    if abs(elapsed - typical_duration) <= typical_duration * 0.25:
+        return POLL_MIN_INTERVAL
+    # short right after submit, backing off the longer a job runs
+    return min(POLL_MAX_INTERVAL, POLL_MIN_INTERVAL + elapsed * POLL_BACKOFF)
+
+async def poll_until(check, typical_duration, started_at=None, max_wait=None):
+    # call check() on an adaptive schedule until it returns something other than None,
+    # a job still pending after max_wait seconds gives "" like one the api reported as failed
+    started_at = time.time() if started_at is None else started_at
+    while True:
+        result = await check()
+        if result is not None:
+            return result
+        elapsed = time.time() - started_at
+        if max_wait is not None and elapsed >= max_wait:
+            print(f"Gave up polling after {elapsed:.0f}s")
+            return ""
+        await asyncio.sleep(poll_interval(elapsed, typical_duration))
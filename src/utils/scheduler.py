@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+from enum import Enum
+from src.utils.polling import poll_until
+
+
+class JobState(Enum):
+    QUEUED = "queued"
+    SUBMITTED = "submitted"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class Job:
+    def __init__(self, index, prompt, job_id=None, result=None):
+        self.index = index
+        self.prompt = prompt
+        self.state = JobState.DONE if result else JobState.QUEUED
+        self.job_id = job_id
+        self.result = result
+        self.attempts = 0
+
+    def __repr__(self):
+        return f"Job({self.index}, {self.state.value}, attempts={self.attempts})"
+
+class JobScheduler:
+    # submit(job) -> job id or None, check(job_id) -> result, "" on failure, None while pending
+    def __init__(self, submit, check, concurrency, typical_duration, max_retries=2, on_complete=None, shared_semaphore=None, max_wait=None):
+        self.submit = submit
+        self.check = check
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # optional cap shared with other schedulers, e.g. the upstream api's limit across generations
+        self.shared_semaphore = shared_semaphore or contextlib.nullcontext()
+        self.typical_duration = typical_duration
+        self.max_retries = max_retries
+        # a job pending longer than this is treated as failed and resubmitted
+        self.max_wait = max_wait
+        self.on_complete = on_complete
+        self.jobs = []
+        self.tasks = []
+
+    async def run_job(self, job):
+        async with self.semaphore, self.shared_semaphore:
+            while job.state not in (JobState.DONE, JobState.FAILED):
+                job.attempts += 1
+                # a job resumed with an id that was already submitted is polled instead of paying for it again
+                if job.attempts > 1 or not job.job_id:
+                    job.job_id = await self.submit(job)
+                if job.job_id:
+                    job.state = JobState.SUBMITTED
+                    job.result = await poll_until(lambda: self.poll(job), self.typical_duration, max_wait=self.max_wait)
+                if job.result:
+                    job.state = JobState.DONE
+                elif job.attempts > self.max_retries:
+                    print(f"Job {job.index} failed after {job.attempts} attempts")
+                    job.state = JobState.FAILED
+                else:
+                    print(f"Job {job.index} failed, resubmitting (attempt {job.attempts + 1})")
+                    job.state = JobState.QUEUED
+        if self.on_complete:
+            await self.on_complete(job)
+        return job
+
+    async def poll(self, job):
+        result = await self.check(job.job_id)
+        if result is None:
+            job.state = JobState.RUNNING
+        return result
+
+    def add(self, prompt, job_id=None, result=None):
+        # queue a job as soon as its prompt is known, it starts once a slot is free
+        job = Job(len(self.jobs), prompt, job_id, result)
+        self.jobs.append(job)
+        self.tasks.append(asyncio.create_task(self.run_job(job)))
+        return job
+
+    async def join(self):
+        return await asyncio.gather(*self.tasks)
+
+    async def run(self, prompts):
+        for prompt in prompts:
+            self.add(prompt)
+        return await self.join()
+
+    async def cancel(self):
+        # stop polling and resubmitting, e.g. when the generation using this scheduler failed
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def count(self, *states):
+        return len([job for job in self.jobs if job.state in states])
@@ -1,28 +1,61 @@
-from collections import OrderedDict
 import os
 import asyncio
 import random
+import time
 import wave
+import numpy as np
 from discord.ext import commands
 from discord.sinks import Sink
 
-# Import the WhisperModel from faster-whisper
-from faster_whisper import WhisperModel
-
 # Import Deepgram client
 from deepgram import DeepgramClient, DeepgramClientOptions, LiveTranscriptionEvents, LiveOptions
 
-import io
-
 from utils.plot import generate_voice_response
 from utils.synthesis import synthesize_and_stream_audio
 from utils.transcript import BOOST_WORDS  # For in-memory byte streams
+from src.utils.audio import RingBuffer, SpeechGate, pcm_to_float32
+from src.utils.batcher import TranscriptionBatcher
+from src.utils.chat_context import trim_history
+from src.utils.transcript_store import TranscriptStore
+from config.constants import VAD_ENABLED, CLIP_TRANSCRIPTION_QUEUE_SIZE, CLIP_MIN_DURATION, CLIP_MAX_DURATION, VOICE_HISTORY_TOKEN_BUDGET, WRITER_BACKLOG_WARN, WRITER_FLUSH_WARN
+
+class ClipTranscriber:
+    # transcribes finished clips in the background so clip rollover never blocks the loop
+    def __init__(self, batcher, loop, max_pending=CLIP_TRANSCRIPTION_QUEUE_SIZE):
+        self.batcher = batcher
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        # enough workers to fill a batch, so clips from different speakers share one model call
+        self.tasks = [loop.create_task(self.run()) for _ in range(batcher.max_batch_size)]
+
+    def submit(self, pcm, sample_rate, n_channels, transcript_path):
+        # takes the clip's raw pcm so the model never has to re-read and re-parse the wav
+        try:
+            self.queue.put_nowait((pcm, sample_rate, n_channels, transcript_path))
+        except asyncio.QueueFull:
+            print(f"Transcription queue full, skipping {transcript_path}")
+
+    async def run(self):
+        while True:
+            pcm, sample_rate, n_channels, transcript_path = await self.queue.get()
+            audio = await asyncio.to_thread(pcm_to_float32, pcm, sample_rate, n_channels)
+            try:
+                text = await self.batcher.transcribe(audio)
+            except Exception as e:
+                print(f"Failed to transcribe {transcript_path}: {e}")
+                continue
+            # save transcript with clip
+            with open(transcript_path, "w") as f:
+                f.write(text)
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
 
 class UserAudioFiles:
-    def __init__(self, user_id, n_channels, sample_rate, loop, model):
+    def __init__(self, user_id, n_channels, sample_rate, loop, transcriber):
         self.sample_rate = sample_rate
         self.n_channels = n_channels
-        self.model = model
+        self.transcriber = transcriber
         # create a directory for the user if it doesn't exist
         os.makedirs(f"recordings/{user_id}", exist_ok=True)
         self.user_id = user_id
@@ -34,7 +67,11 @@ class UserAudioFiles:
         latest_file.setframerate(sample_rate)
 
         self.latest_file = latest_file
+        self.clip_chunks = []  # pcm of the current clip, kept for in-memory transcription
         self.write_queue = asyncio.Queue()
+        # backlog left and bytes/s at the last flush, so we can tell when a big call falls behind
+        self.stats = {"queue_depth": 0, "packets": 0, "bytes_per_second": 0.0, "flush_latency": 0.0}
+        self.last_flush = time.perf_counter()
         self.loop = loop
         self.loop.create_task(self.manage_files())
 
@@ -43,33 +80,49 @@ class UserAudioFiles:
 
     def strip_leading_silence(self, data):
         # Strip only the leading silence and return the rest of the data
-        silence_chunk_size = 2  # Since we're using 16-bit samples, each sample is 2 bytes
-        idx = 0
-        while idx < len(data) - silence_chunk_size:
-            # Check 2 bytes at a time for leading silence
-            if data[idx:idx+silence_chunk_size] != b'\x00\x00':
-                self.stripped_leading_silence = True  # Stop stripping silence after finding sound
-                return data[idx:]
-            idx += silence_chunk_size
-        return b''  # If the entire data chunk is silence, return empty
+        samples = np.frombuffer(data, dtype=np.int16, count=len(data) // 2)
+        sound = np.flatnonzero(samples)
+        if len(sound) == 0:
+            return b''  # If the entire data chunk is silence, return empty
+        self.stripped_leading_silence = True  # Stop stripping silence after finding sound
+        return data[sound[0] * 2:]
 
     async def manage_files(self):
         while True:
             await asyncio.sleep(1)
+            utterance_ended = False
             if self.write_queue.qsize() > 0:
-                # current clip length
-                current_length = self.latest_file.tell()
-                data = b''
+                flush_start = time.perf_counter()
+                # collect the packets and join once instead of re-concatenating bytes per packet
+                packets = []
                 while not self.write_queue.empty():
-                    data += await self.write_queue.get()
-                data = self.strip_leading_silence(data)
+                    packet = self.write_queue.get_nowait()
+                    if packet is None:
+                        # utterance boundary, packets after it belong to the next clip
+                        utterance_ended = True
+                        break
+                    packets.append(packet)
+                data = self.strip_leading_silence(b''.join(packets))
                 self.latest_file.writeframes(data)
-            if self.latest_file.tell() >= self.sample_rate * 15:
-                segments, info = self.model.transcribe(self.from_index(self.latest_file_idx))
-                # save transcript with clip
-                with open(f"./recordings/{self.user_id}/{self.latest_file_idx}.txt", "w") as f:
-                    for segment in segments:
-                        f.write(segment.text)
+                self.clip_chunks.append(data)
+                flush_end = time.perf_counter()
+                self.stats = {
+                    # packets still waiting, anything queued after an utterance boundary or during the flush
+                    "queue_depth": self.write_queue.qsize(),
+                    "packets": len(packets),
+                    "bytes_per_second": len(data) / (flush_end - self.last_flush),
+                    "flush_latency": flush_end - flush_start,
+                }
+                self.last_flush = flush_end
+                if self.stats["queue_depth"] > WRITER_BACKLOG_WARN or self.stats["flush_latency"] > WRITER_FLUSH_WARN:
+                    print(f"Writer for {self.user_id} falling behind: {self.stats}")
+            # clips end where the speaker paused, so each transcription gets whole utterances
+            clip_frames = self.latest_file.tell()
+            if (utterance_ended and clip_frames >= self.sample_rate * CLIP_MIN_DURATION) or clip_frames >= self.sample_rate * CLIP_MAX_DURATION:
+                # close first so the wav header is complete before the clip is transcribed
+                self.latest_file.close()
+                self.transcriber.submit(b''.join(self.clip_chunks), self.sample_rate, self.n_channels, f"./recordings/{self.user_id}/{self.latest_file_idx}.txt")
+                self.clip_chunks = []
                 self.latest_file_idx += 1
                 self.latest_file = self.prep_new_file(self.from_index(self.latest_file_idx))
     def prep_new_file(self, dir):
@@ -81,9 +134,13 @@ class UserAudioFiles:
     def write(self, data):
         self.loop.call_soon_threadsafe(self.write_queue.put_nowait, data)
 
+    def end_utterance(self):
+        # called from the voice thread when the speech gate closes, queued in order with the audio
+        self.loop.call_soon_threadsafe(self.write_queue.put_nowait, None)
+
 
 class RealTimeTranscriptionSink(Sink):
-    def __init__(self, *, filters=None, transcription_method="deepgram"):
+    def __init__(self, model, *, filters=None, transcription_method="deepgram"):
         super().__init__(filters=filters)
         self.loop = asyncio.get_event_loop()
         # print in the loop every frame
@@ -94,10 +151,13 @@ class RealTimeTranscriptionSink(Sink):
         self.transcription_task = None
         self.is_running = True
         self.dg_connection = None  # For Deepgram
-        self.model = WhisperModel("large-v3", device="cuda", compute_type="float16")
+        # loaded by the caller off the event loop, large-v3 takes a while the first time
+        self.model = model
+        self.batcher = TranscriptionBatcher(self.model, self.loop)
+        self.clip_transcriber = ClipTranscriber(self.batcher, self.loop)
         self.audio_files = {}
-        self.running_transcript_chunks = OrderedDict()
-        self.interrim_chunk_ids = []
+        self.speech_gates = {}
+        self.running_transcript = TranscriptStore()
         self.openai_message_history = []
     
     def init(self, vc):
@@ -112,8 +172,6 @@ class RealTimeTranscriptionSink(Sink):
             self.loop.create_task(self.setup_deepgram())
             self.transcription_task = self.loop.create_task(self.transcribe_audio_deepgram())
         elif self.transcription_method == "faster-whisper":
-            # Initialize the faster-whisper model
-            self.model = WhisperModel("large-v3", device="cuda", compute_type="float16")
             self.transcription_task = self.loop.create_task(self.transcribe_audio_whisper())
         else:
             raise ValueError("Invalid transcription method specified.")
@@ -122,6 +180,8 @@ class RealTimeTranscriptionSink(Sink):
         current_transcript = self.get_running_transcript()
 
         self.openai_message_history.append({"role": "user", "content": current_transcript})
+        # only the newest turns that fit the budget are sent and kept, so long sessions don't grow the prompt
+        self.openai_message_history = trim_history(self.openai_message_history, VOICE_HISTORY_TOKEN_BUDGET)
         self.openai_message_history = await generate_voice_response(self.openai_message_history)
         response = self.openai_message_history[-1]["content"]
         print(response)
@@ -136,8 +196,7 @@ class RealTimeTranscriptionSink(Sink):
         response = response.replace("BlinkBot:", "")
         await synthesize_and_stream_audio(self.vc, response, [f"recordings/{random_user}/{random_file_idx}.wav"], [f"recordings/{random_user}/{random_file_idx}.txt"])
         # wipe the running transcript chunks
-        self.running_transcript_chunks = OrderedDict()
-        self.interrim_chunk_ids = []
+        self.running_transcript.clear()
     
     async def on_utterance_end(self, dg, *args, **kwargs):
         return
@@ -222,20 +281,16 @@ class RealTimeTranscriptionSink(Sink):
         if len(sentence) == 0:
             return
         if result.is_final:
-            if result.start in self.interrim_chunk_ids:
-                # print(f"Replacing interim chunk {self.running_transcript_chunks[result.metadata.request_id]} with {transcript}")
-                self.running_transcript_chunks[result.start] = transcript
-            else:
-                self.running_transcript_chunks[result.start] = transcript
+            # settles the chunk, replacing its interim result if there was one
+            self.running_transcript.finalize(result.start, transcript)
         else:
             print(f"Interim chunk {result.start}")
-            self.running_transcript_chunks[result.start] = transcript
-            self.interrim_chunk_ids.append(result.start)
+            self.running_transcript.set_interim(result.start, transcript)
         if result.speech_final:
             await self.generate_response()
     
     def get_running_transcript(self):
-        return "".join(self.running_transcript_chunks.values())
+        return self.running_transcript.render()
 
     async def on_close(self, dg, *args, **kwargs):
         print("Deepgram Connection Closed")
@@ -248,25 +303,25 @@ class RealTimeTranscriptionSink(Sink):
         print("Whisper transcription started.")
 
         chunk_length_s = 10  # Duration of each audio chunk in seconds
-        stream_chunk_s = 3  # Process every 0.5 seconds
+        stream_chunk_s = 3  # Process every 3 seconds
         stride_length_s = (1,1)  # Overlap of 1 second on each side
 
-        size_of_sample = 2  # Since we're using int16 (2 bytes per sample)
         channels = self.n_channels
 
-        # Calculate sizes in bytes
-        chunk_size_bytes = int(self.sample_rate * chunk_length_s * channels * size_of_sample)
-        stream_chunk_size_bytes = int(self.sample_rate * stream_chunk_s * channels * size_of_sample)
-        stride_left_bytes = int(self.sample_rate * stride_length_s[0] * channels * size_of_sample)
-        stride_right_bytes = int(self.sample_rate * stride_length_s[1] * channels * size_of_sample)
+        # Calculate sizes in int16 samples (interleaved across channels)
+        chunk_size = int(self.sample_rate * chunk_length_s * channels)
+        stream_chunk_size = int(self.sample_rate * stream_chunk_s * channels)
+        stride_left = int(self.sample_rate * stride_length_s[0] * channels)
+        stride_right = int(self.sample_rate * stride_length_s[1] * channels)
 
         # Total size of chunk including strides
-        total_chunk_size_bytes = stride_left_bytes + chunk_size_bytes + stride_right_bytes
+        total_chunk_size = stride_left + chunk_size + stride_right
 
-        buffer = b''
+        # room for a full window plus the packets that arrive while it is transcribed
+        buffer = RingBuffer(total_chunk_size * 2)
 
         # Prepend zeros to the buffer to handle the initial left stride
-        buffer += b'\x00' * stride_left_bytes
+        buffer.write(np.zeros(stride_left, dtype=np.int16))
 
         while self.is_running:
             # Collect data from the audio queue
@@ -274,43 +329,24 @@ class RealTimeTranscriptionSink(Sink):
             if data is None:
                 break
 
-            # Append data to the buffer
-            buffer += data
-
-            buffer_file = wave.open("buffer.wav", "wb")
-            buffer_file.setnchannels(self.n_channels)
-            buffer_file.setsampwidth(size_of_sample)
-            buffer_file.setframerate(self.sample_rate)
-            buffer_file.writeframes(buffer)
-            buffer_file.close()
+            buffer.write(data)
 
-            # Process the buffer if we have enough bytes
-            while len(buffer) >= total_chunk_size_bytes:
-                # Extract the chunk with strides
-                chunk_with_strides = buffer[:total_chunk_size_bytes]
+            # Process the buffer if we have enough samples
+            while len(buffer) >= total_chunk_size:
+                # Extract the chunk with strides and hand it to the model as floats, no wav round trip,
+                # converting in a thread so resampling the 12 s window never stalls the voice loop
+                audio = await asyncio.to_thread(pcm_to_float32, buffer.read(total_chunk_size), self.sample_rate, channels)
 
-                # Remove the processed part from the buffer, advance by stream_chunk_size_bytes
-                buffer = buffer[stream_chunk_size_bytes:]
+                # Advance by one stream chunk, keeping the overlap for the next window
+                buffer.advance(stream_chunk_size)
 
-                # Create an in-memory byte stream
-                audio_stream = io.BytesIO(chunk_with_strides)
-
-                chunked_file = wave.open("chunked.wav", "wb")
-                chunked_file.setnchannels(self.n_channels)
-                chunked_file.setsampwidth(size_of_sample)
-                chunked_file.setframerate(self.sample_rate)
-                chunked_file.writeframes(chunk_with_strides)
-                chunked_file.close()
-
-                # Transcribe using faster-whisper
-                segments, _ = self.model.transcribe(
-                    "chunked.wav",
-                    language="en",
-                    beam_size=5,
-                    without_timestamps=True,
-                )
-
-                transcript = "".join([segment.text for segment in segments])
+                # Transcribe using faster-whisper, batched with any clips that are ready
+                try:
+                    transcript = await self.batcher.transcribe(audio)
+                except Exception as e:
+                    # one bad window shouldn't end live transcription for the rest of the call
+                    print(f"Whisper Error: {e}")
+                    continue
 
                 if transcript.strip():
                     print(f"Whisper Transcription: {transcript}")
@@ -322,17 +358,36 @@ class RealTimeTranscriptionSink(Sink):
         if (self.n_channels or self.sample_rate) is None:
             return
 
+        # drop silent frames here, before they are queued for transcription or written to disk
+        if VAD_ENABLED:
+            if user not in self.speech_gates:
+                self.speech_gates[user] = SpeechGate(self.sample_rate, self.n_channels, on_utterance=lambda duration, user=user: self.on_utterance(user, duration))
+            data = self.speech_gates[user].process(data)
+            if data is None:
+                return
+
         self.loop.call_soon_threadsafe(self.audio_queue.put_nowait, data)
         if user not in self.audio_files:
-            self.audio_files[user] = UserAudioFiles(user, self.n_channels, self.sample_rate, self.loop, self.model)
+            self.audio_files[user] = UserAudioFiles(user, self.n_channels, self.sample_rate, self.loop, self.clip_transcriber)
         self.audio_files[user].write(data)
 
+    def on_utterance(self, user, duration):
+        print(f"Utterance from {user}: {duration:.1f}s")
+        if user in self.audio_files:
+            self.audio_files[user].end_utterance()
+
+    def writer_stats(self):
+        return {user: audio_file.stats for user, audio_file in self.audio_files.items()}
+
     ### Cleanup Method ###
     def cleanup(self):
         super().cleanup()
         self.is_running = False
         if self.transcription_task:
             self.transcription_task.cancel()
+        self.clip_transcriber.stop()
+        self.batcher.stop()
+        print("Writer stats:", self.writer_stats())
 
         # Signal the audio queue to stop by putting None into it
         self.loop.call_soon_threadsafe(self.audio_queue.put_nowait, None)
@@ -1,7 +1,10 @@
+import asyncio
+import heapq
 import os
 import time
 from deepgram import FileSource
 import httpx
+from config.constants import TRANSCRIPTION_CONCURRENCY
 
 BOOST_WORDS = ["Reyna", "Nayo", "Sage", "Killjoy", "Viper", "Raze", "Skye", "Cypher", "Sova", "Brimstone", "Phoenix", "KAY/O", "Chamber", "Neon", "Fade", "Deadlock", "Pramit", "Jon", "Lucy", "Kwon"]
 
@@ -18,32 +21,39 @@ def replace_usernames(transcript):
         transcript = transcript.replace(name, username_mapping[name])
     return transcript
 
-async def transcribe_audio(sink, deepgram, options):
+def transcribe_speaker(user_id, audio_data, deepgram, options):
+    payload: FileSource = {"buffer": audio_data}
 
-    words_list = []
-    for user_id, audio in sink.audio_data.items():
+    os.makedirs(f"audio/{user_id}", exist_ok=True)
+    with open(f"audio/{user_id}/{user_id}_{time.time()}.wav", "wb") as f:
+        f.write(audio_data)
+
+    response = deepgram.listen.prerecorded.v("1").transcribe_file(payload, options, timeout=httpx.Timeout(300.0, connect=10))
+    words = response["results"]["channels"][0]["alternatives"][0]["words"]
+    words = [word.to_dict() for word in words]
+
+    return [
+        {
+            "word": word["word"],
+            "start": word["start"],
+            "end": word["end"],
+            "confidence": word["confidence"],
+            "punctuated_word": word["punctuated_word"],
+            "speaker": user_id,
+            "speaker_confidence": word["speaker_confidence"],
+        }
+        for word in words
+    ]
+
+async def transcribe_audio(sink, deepgram, options, max_concurrency=TRANSCRIPTION_CONCURRENCY):
+    # every speaker is uploaded at once (up to max_concurrency) on worker threads so the event loop keeps running
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def transcribe(user_id, audio):
         audio_data = audio.file.read()
-        payload: FileSource = {"buffer": audio_data}
-
-        os.makedirs(f"audio/{user_id}", exist_ok=True)
-        with open(f"audio/{user_id}/{user_id}_{time.time()}.wav", "wb") as f:
-            f.write(audio_data)
-
-        response = deepgram.listen.prerecorded.v("1").transcribe_file(payload, options, timeout=httpx.Timeout(300.0, connect=10))
-        words = response["results"]["channels"][0]["alternatives"][0]["words"]
-        words = [word.to_dict() for word in words]
-
-        for word in words:
-            new_word = {
-                "word": word["word"],
-                "start": word["start"],
-                "end": word["end"],
-                "confidence": word["confidence"],
-                "punctuated_word": word["punctuated_word"],
-                "speaker": user_id,
-                "speaker_confidence": word["speaker_confidence"],
-            }
-            words_list.append(new_word)
-    
-    words_list.sort(key=lambda x: x["start"])
-    return words_list
\ No newline at end of file
+        async with semaphore:
+            return await asyncio.to_thread(transcribe_speaker, user_id, audio_data, deepgram, options)
+
+    speaker_words = await asyncio.gather(*(transcribe(user_id, audio) for user_id, audio in sink.audio_data.items()))
+    # each speaker's words are already in time order, so merge instead of re-sorting everything
+    return list(heapq.merge(*speaker_words, key=lambda x: x["start"]))
@@ -0,0 +1,45 @@
+from collections import deque
+from src.utils.chat_context import estimate_tokens
+from config.constants import VOICE_TRANSCRIPT_TOKEN_BUDGET
+
+
+class TranscriptStore:
+    # live transcript between replies: interim results are replaced in place by their start time,
+    # finals are settled into a bounded run of text and the oldest are dropped once over budget
+    def __init__(self, token_budget=VOICE_TRANSCRIPT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.settled = deque()  # (text, tokens), oldest first
+        self.settled_tokens = 0
+        self.settled_text = ""
+        self.interim = {}  # start -> text, only the chunks still being revised
+
+    def set_interim(self, start, text):
+        self.interim[start] = text
+
+    def finalize(self, start, text):
+        # the final result replaces its interim and any older interim it superseded
+        self.interim.pop(start, None)
+        for stale in [s for s in self.interim if s < start]:
+            del self.interim[stale]
+        tokens = estimate_tokens(text)
+        self.settled.append((text, tokens))
+        self.settled_tokens += tokens
+        while self.settled_tokens > self.token_budget and len(self.settled) > 1:
+            _, dropped = self.settled.popleft()
+            self.settled_tokens -= dropped
+        # compact settled chunks once so rendering doesn't re-join the whole history every time
+        self.settled_text = "".join(chunk for chunk, _ in self.settled)
+
+    def render(self):
+        if not self.interim:
+            return self.settled_text
+        return self.settled_text + "".join(self.interim[start] for start in sorted(self.interim))
+
+    def clear(self):
+        self.settled.clear()
+        self.settled_tokens = 0
+        self.settled_text = ""
+        self.interim.clear()
+
+    def __len__(self):
+        return len(self.settled) + len(self.interim)
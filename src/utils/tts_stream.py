@@ -0,0 +1,77 @@
+# playback side of the tts stream, kept apart from synthesis.py so it doesn't need fish-speech's tools package
+import asyncio
+import queue
+import time
+from aiohttp import ClientError
+from discord import AudioSource
+from discord.opus import Encoder as OpusEncoder
+from src.utils.audio import StreamResampler
+from config.constants import TTS_SAMPLE_RATE, TTS_CHUNK_SIZE
+
+# the player asks for one 20 ms frame of 48 kHz stereo int16 at a time
+SILENT_FRAME = b"\x00" * OpusEncoder.FRAME_SIZE
+
+
+def strip_wav_header(data):
+    # the streamed wav starts with a header, returns (pcm after it, whether the header is complete)
+    if not data.startswith(b"RIFF"):
+        return data, len(data) >= 4
+    idx = data.find(b"data", 12)
+    if idx == -1 or len(data) < idx + 8:
+        return data, False
+    return data[idx + 8:], True
+
+class TTSStreamSource(AudioSource):
+    # fed from the event loop as the tts response streams in, read by the voice player thread
+    def __init__(self):
+        self.frames = queue.Queue()
+        self.buffer = b""
+        self.finished = False
+        self.feed_task = None
+        self.loop = None
+        self.time_to_first_audio = None
+
+    def read(self):
+        while len(self.buffer) < OpusEncoder.FRAME_SIZE and not self.finished:
+            try:
+                chunk = self.frames.get(timeout=0.02)
+            except queue.Empty:
+                # underrun, keep the player's timing with silence until more audio arrives
+                return SILENT_FRAME
+            if chunk is None:
+                self.finished = True
+            else:
+                self.buffer += chunk
+        if not self.buffer:
+            return b""
+        frame = self.buffer[:OpusEncoder.FRAME_SIZE].ljust(OpusEncoder.FRAME_SIZE, b"\x00")
+        self.buffer = self.buffer[OpusEncoder.FRAME_SIZE:]
+        return frame
+
+    def cleanup(self):
+        # called from the player thread when playback stops early
+        if self.feed_task and not self.feed_task.done():
+            self.loop.call_soon_threadsafe(self.feed_task.cancel)
+
+    async def feed(self, response, started):
+        resampler = StreamResampler(TTS_SAMPLE_RATE, OpusEncoder.SAMPLING_RATE, OpusEncoder.CHANNELS)
+        header = b""
+        header_done = False
+        try:
+            async for chunk in response.content.iter_chunked(TTS_CHUNK_SIZE):
+                if not header_done:
+                    chunk, header_done = strip_wav_header(header + chunk)
+                    if not header_done:
+                        header = chunk
+                        continue
+                pcm = resampler.process(chunk)
+                if pcm:
+                    if self.time_to_first_audio is None:
+                        self.time_to_first_audio = time.monotonic() - started
+                        print(f"TTS time to first audio: {self.time_to_first_audio:.2f}s")
+                    self.frames.put(pcm)
+        except (asyncio.TimeoutError, ClientError) as e:
+            print(f"TTS stream interrupted: {e!r}")
+        finally:
+            response.release()
+            self.frames.put(None)
@@ -1,40 +1,143 @@
+import asyncio
+import glob
 import math
 import os
 import re
 import subprocess
-from aiohttp import ClientSession
-from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips
-from moviepy.video.fx.all import loop
-import stable_whisper
+from aiohttp import ClientError, ClientTimeout
 import time
+from config.constants import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_READ_TIMEOUT, DOWNLOAD_MAX_RETRIES, DOWNLOAD_RETRY_BACKOFF, RENDER_WIDTH, RENDER_HEIGHT, RENDER_FPS, RENDER_ENGINE, RENDER_CODEC, RENDER_PRESET, RENDER_THREADS, COMPRESSION_CODEC, COMPRESSION_AUDIO_BITRATE, COMPRESSION_OVERHEAD, COMPRESSION_TWO_PASS, ALIGNMENT_MODEL
+from src.utils.api_reqs import RETRY_STATUSES
+from src.utils.models import get_model
+from src.utils.workers import run_in_process, run_subprocess
 
 
 async def download_file(session, url, filename):
-    async with session.get(url) as response:
-        if response.status == 200:
-            with open(filename, 'wb') as f:
-                f.write(await response.read())
-            return filename
-
-async def merge_videos_and_song(song_url, song_lyrics, video_urls, subtitle_properties):
-    model = stable_whisper.load_model("base")
+    # stream to disk in chunks so a clip is never held in memory all at once,
+    # transient cdn errors are retried and None is returned once they keep failing
+    timeout = ClientTimeout(total=None, sock_read=DOWNLOAD_READ_TIMEOUT)
+    for attempt in range(DOWNLOAD_MAX_RETRIES + 1):
+        try:
+            async with session.get(url, timeout=timeout) as response:
+                if response.status == 200:
+                    with open(filename, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                    return filename
+                error = response.status
+                if response.status not in RETRY_STATUSES:
+                    break
+        except (ClientError, asyncio.TimeoutError) as e:
+            error = repr(e)
+        if attempt < DOWNLOAD_MAX_RETRIES:
+            delay = DOWNLOAD_RETRY_BACKOFF * 2 ** attempt
+            print(f"Retrying download of {url} in {delay}s after {error} (attempt {attempt + 1}/{DOWNLOAD_MAX_RETRIES})")
+            await asyncio.sleep(delay)
+    print(f"Error downloading {url}: {error}")
+    return None
+
+async def normalize_clip(input_path, output_path):
+    # bring every clip to the same resolution/fps/codec as it arrives so the final render is a straight concat
+    video_filter = (
+        f"scale={RENDER_WIDTH}:{RENDER_HEIGHT}:force_original_aspect_ratio=decrease,"
+        f"pad={RENDER_WIDTH}:{RENDER_HEIGHT}:(ow-iw)/2:(oh-ih)/2,fps={RENDER_FPS},format=yuv420p"
+    )
+    returncode = await run_subprocess([
+        "ffmpeg", "-y", "-v", "error", "-i", input_path, "-vf", video_filter,
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-an", output_path,
+    ])
+    if returncode != 0:
+        print(f"Failed to normalize {input_path}")
+        return None
+    return output_path
+
+def align_lyrics(song_path, song_lyrics):
+    # cpu heavy, run off the event loop as soon as the song is downloaded
+    model = get_model("stable-whisper", ALIGNMENT_MODEL)
     lyrics = re.sub(r'\[.*?\]|\(.*?\)', '', song_lyrics)
     # remove all symbols and punctuation other than periods, commas, and question marks
     lyrics = re.sub(r'[^\w\s.,?!]', '', lyrics).strip()
+    return model.align(song_path, lyrics, language='en', fast_mode=True, regroup='cm_sp=,* /，/\n/\\_sg=.5_sp=.* /。/?/？')
+
+def align_lyrics_to_file(song_path, song_lyrics, path):
+    # the alignment is also checkpointed as a json file so a resumed generation can skip it
+    return save_alignment(align_lyrics(song_path, song_lyrics), path)
+
+def save_alignment(alignment, path):
+    alignment.save_as_json(path)
+    return path
+
+def load_alignment(path):
+    import stable_whisper
+    return stable_whisper.WhisperResult(path)
+
+def write_subtitles(alignment, subtitle_properties, ass_path='./output.ass'):
     # delete existing ass file
-    ass_path = './output.ass'
     if os.path.exists(ass_path):
         os.remove(ass_path)
     print("subtitle_properties")
     print(subtitle_properties)
+    highlight_color = subtitle_properties["font_color"].strip("#")
+    alignment.to_ass(ass_path, karaoke=True, font=subtitle_properties["font"], highlight_color=highlight_color)
+    return ass_path
 
-    async with ClientSession() as session:
-        song_path = await download_file(session, song_url, 'song.mp3')
-        video_paths = [await download_file(session, video_url, f'video_{i+1}.mp4') for i, video_url in enumerate(video_urls)]
+async def merge_videos_and_song(song_path, video_paths, ass_path, compressed_output_path=None, target_size_mb=None, output_path=None, on_progress=None):
+    # when compressed_output_path is given the size capped copy is written alongside the full quality render
+    output_path = output_path or f"final_output_with_subtitles_{time.time()}.mp4"
+    if RENDER_ENGINE == "ffmpeg":
+        try:
+            if await render_with_ffmpeg(song_path, video_paths, ass_path, output_path, compressed_output_path, target_size_mb, on_progress):
+                # the single pass copy is capped by -maxrate but can still overshoot, redo it from the full render with two passes
+                if compressed_output_path and not fits(compressed_output_path, target_size_mb):
+                    print(f"Compressed render is over the {target_size_mb} MB target, re-encoding it in two passes")
+                    await compress_video(output_path, compressed_output_path, target_size_mb, two_pass=True)
+                return output_path
+        except FileNotFoundError:
+            print("ffmpeg not found")
+        print("Falling back to moviepy render")
+    await run_in_process(render_with_moviepy, song_path, video_paths, ass_path, output_path)
+    if compressed_output_path:
+        await compress_video(output_path, compressed_output_path, target_size_mb)
+    return output_path
 
-    result = model.align('./song.mp3', lyrics, language='en', fast_mode=True, regroup='cm_sp=,* /，/\n/\\_sg=.5_sp=.* /。/?/？')
-    highlight_color = subtitle_properties["font_color"].strip("#")
-    ass_out = result.to_ass(ass_path, karaoke=True, font=subtitle_properties["font"], highlight_color=highlight_color)
+async def render_with_ffmpeg(song_path, video_paths, ass_path, output_path, compressed_output_path=None, target_size_mb=None, on_progress=None):
+    # clips are already normalized, so the concat demuxer can read them back to back without moviepy decoding frames
+    concat_path = f"{os.path.splitext(output_path)[0]}_concat.txt"
+    with open(concat_path, 'w') as f:
+        for video_path in video_paths:
+            f.write(f"file '{os.path.abspath(video_path)}'\n")
+    command = [
+        "ffmpeg", "-y", "-v", "error",
+        # loop the clips forever and cut every output at the song's length
+        "-stream_loop", "-1", "-f", "concat", "-safe", "0", "-i", concat_path,
+        "-i", song_path,
+    ]
+    duration = await asyncio.to_thread(get_video_duration, song_path)
+    # -t instead of -shortest: -shortest buffers up to 10 s of decoded frames per output and overshoots the song
+    full_quality = ["-c:v", RENDER_CODEC, "-preset", RENDER_PRESET, "-threads", str(RENDER_THREADS), "-c:a", "aac", "-t", f"{duration:.3f}"]
+    if compressed_output_path:
+        # decode and burn subtitles once, then split the frames between both encoders
+        video_bitrate_k = calculate_video_bitrate_k(target_size_mb, duration)
+        command += [
+            "-filter_complex", f"[0:v]subtitles={ass_path},split=2[full][small]",
+            "-map", "[full]", "-map", "1:a", *full_quality, output_path,
+            "-map", "[small]", "-map", "1:a",
+            "-c:v", COMPRESSION_CODEC, "-b:v", f"{video_bitrate_k}k",
+            "-maxrate", f"{video_bitrate_k}k", "-bufsize", f"{video_bitrate_k * 2}k",
+            "-c:a", "aac", "-b:a", f"{COMPRESSION_AUDIO_BITRATE}k", "-t", f"{duration:.3f}", compressed_output_path,
+        ]
+    else:
+        command += ["-map", "0:v", "-map", "1:a", "-vf", f"subtitles={ass_path}", *full_quality, output_path]
+    returncode = await run_subprocess(command, duration, on_progress)
+    if returncode != 0:
+        print(f"ffmpeg render failed with exit code {returncode}")
+        return False
+    return True
+
+def render_with_moviepy(song_path, video_paths, ass_path, output_path):
+    # only imported when the ffmpeg render can't be used
+    from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips
+    from moviepy.video.fx.all import loop
 
     video_clips = [VideoFileClip(video) for video in video_paths]
     concatenated_clip = concatenate_videoclips(video_clips)
@@ -42,8 +145,7 @@ async def merge_videos_and_song(song_url, song_lyrics, video_urls, subtitle_prop
     song_audio = AudioFileClip(song_path)
     final_video_clip = loop(concatenated_clip, duration=song_audio.duration).set_audio(song_audio)
 
-    output_path = f"final_output_with_subtitles_{time.time()}.mp4"
-    final_video_clip.write_videofile(output_path, codec='libx265', audio_codec='aac', ffmpeg_params=['-vf', f"subtitles={ass_path}"])
+    final_video_clip.write_videofile(output_path, codec=RENDER_CODEC, audio_codec='aac', threads=RENDER_THREADS or None, preset=RENDER_PRESET, ffmpeg_params=['-vf', f"subtitles={ass_path}"])
 
     song_audio.close()
     final_video_clip.close()
@@ -51,8 +153,6 @@ async def merge_videos_and_song(song_url, song_lyrics, video_urls, subtitle_prop
     for video in video_clips:
         video.close()
 
-    return output_path
-
 # Calculate target bitrate based on desired file size (in bits)
 def calculate_target_bitrate(target_size_mb, duration_s):
     target_size_bits = target_size_mb * 8 * 1024 * 1024
@@ -67,28 +167,36 @@ def get_video_duration(input_path):
     ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     return float(result.stdout)
 
-# Compress video to target size
-def compress_video(input_path, output_path, target_size_mb):
-    duration = get_video_duration(input_path)
-    target_bitrate = calculate_target_bitrate(target_size_mb, duration)
-    target_bitrate_k = math.floor(target_bitrate / 1000)  # in kilobits per second
-
-    for attempt in range(10):
-        print(f"Attempt {attempt + 1}: Compressing with target bitrate {target_bitrate_k}k...")
-        
-        command = [
-            "ffmpeg", "-i", input_path, "-b:v", f"{target_bitrate_k}k", "-bufsize", f"{target_bitrate_k}k",
-            "-maxrate", f"{target_bitrate_k}k", "-pass", "1", "-c:a", "aac", "-b:a", "128k", output_path, "-y"
-        ]
-        subprocess.run(command)
-
-        # Check if the file size is under the target size
-        output_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-        if output_size_mb <= target_size_mb:
-            print(f"Compression successful: Output file size is {output_size_mb:.2f} MB")
-            break
-        else:
-            print(f"Output file size is {output_size_mb:.2f} MB, reducing bitrate further...")
-            target_bitrate_k = int(target_bitrate_k * 0.85)  # Reduce bitrate further if needed
+# Bitrate left for video once audio and container overhead are budgeted, in kilobits per second
+def calculate_video_bitrate_k(target_size_mb, duration_s, audio_bitrate_k=COMPRESSION_AUDIO_BITRATE, overhead=COMPRESSION_OVERHEAD):
+    total_bitrate_k = calculate_target_bitrate(target_size_mb, duration_s) * (1 - overhead) / 1000
+    return max(1, math.floor(total_bitrate_k - audio_bitrate_k))
+
+def fits(path, target_size_mb):
+    return os.path.getsize(path) <= target_size_mb * 1024 * 1024
+
+# Compress video to target size in one deterministic encode, or a true two-pass encode
+async def compress_video(input_path, output_path, target_size_mb, two_pass=COMPRESSION_TWO_PASS):
+    duration = await asyncio.to_thread(get_video_duration, input_path)
+    video_bitrate_k = calculate_video_bitrate_k(target_size_mb, duration)
+    rate_control = [
+        "-c:v", COMPRESSION_CODEC, "-b:v", f"{video_bitrate_k}k",
+        "-maxrate", f"{video_bitrate_k}k", "-bufsize", f"{video_bitrate_k * 2}k",
+    ]
+    audio = ["-c:a", "aac", "-b:a", f"{COMPRESSION_AUDIO_BITRATE}k"]
+    print(f"Compressing with video bitrate {video_bitrate_k}k ({'two-pass' if two_pass else 'single pass'})...")
+
+    if two_pass:
+        passlog = f"{output_path}.passlog"
+        await run_subprocess(["ffmpeg", "-y", "-i", input_path, *rate_control, "-pass", "1", "-passlogfile", passlog, "-an", "-f", "mp4", os.devnull])
+        await run_subprocess(["ffmpeg", "-y", "-i", input_path, *rate_control, "-pass", "2", "-passlogfile", passlog, *audio, output_path])
+        for log_file in glob.glob(f"{passlog}*"):
+            os.remove(log_file)
+    else:
+        await run_subprocess(["ffmpeg", "-y", "-i", input_path, *rate_control, *audio, output_path])
+
+    output_size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    if output_size_mb <= target_size_mb:
+        print(f"Compression successful: Output file size is {output_size_mb:.2f} MB")
     else:
-        print("Warning: Maximum attempts reached. Could not reach target size.")
\ No newline at end of file
+        print(f"Warning: Output file size is {output_size_mb:.2f} MB, over the {target_size_mb} MB target")
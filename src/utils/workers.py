@@ -0,0 +1,42 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from config.constants import MEDIA_WORKERS
+
+_process_pool = None
+
+
+def get_process_pool():
+    # spawn so workers don't inherit the bot's event loop, sockets or threads
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+async def run_in_process(fn, *args):
+    # cpu heavy python work (moviepy, whisper) runs in a worker process so the bot's loop stays responsive
+    return await asyncio.get_running_loop().run_in_executor(get_process_pool(), fn, *args)
+
+async def run_subprocess(command, duration=None, on_progress=None):
+    # run ffmpeg without blocking the loop, killing it if the awaiting task is cancelled
+    if duration and on_progress:
+        command = [command[0], "-progress", "pipe:1", "-nostats", *command[1:]]
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+    try:
+        async for line in process.stdout:
+            # ffmpeg reports out_time_us=<microseconds> for every progress update
+            key, _, value = line.decode(errors="ignore").strip().partition("=")
+            if on_progress and duration and key == "out_time_us" and value.isdigit():
+                on_progress(min(1.0, int(value) / 1_000_000 / duration))
+        return await process.wait()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+def shutdown():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+    _process_pool = None
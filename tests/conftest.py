@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+# modules import each other as src.utils.x and config.constants, from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# plot.py builds its openai client at import, tests point it at a fake server instead
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    # jobs in tests finish in milliseconds, poll on the same scale
+    from src.utils import polling
+    monkeypatch.setattr(polling, "POLL_MIN_INTERVAL", 0.005)
+    monkeypatch.setattr(polling, "POLL_MAX_INTERVAL", 0.02)
@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import pytest
+from benchmarks.mock_api import MockAPI
+from src.utils import api_reqs
+from src.utils.api_reqs import close_session, create_request, download_bytes, get_session
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(api_reqs, "API_RETRY_BACKOFF", 0)
+
+def with_api(test):
+    # each test gets a fresh mock server, the pooled session is closed with the loop it was made on
+    async def run():
+        api = await MockAPI().start()
+        try:
+            return await test(api)
+        finally:
+            await close_session()
+            await api.stop()
+    return asyncio.run(run())
+
+def test_get_retries_on_5xx():
+    async def test(api):
+        api.script("/video/1", (503, {}), (502, {}), (200, {"status": 2}))
+        result = await create_request(api.url("/video/1"), {}, method="get")
+        return result, api.hits["/video/1"]
+    assert with_api(test) == ({"status": 2}, 3)
+
+def test_get_gives_up_after_max_retries():
+    async def test(api):
+        api.script("/video/1", (500, {}))
+        result = await create_request(api.url("/video/1"), {}, method="get")
+        return result, api.hits["/video/1"]
+    assert with_api(test) == (None, api_reqs.API_MAX_RETRIES + 1)
+
+def test_post_is_not_retried_on_5xx():
+    # the job may already exist upstream, a retry would pay for it twice
+    async def test(api):
+        api.script("/create", (500, {}), (200, {"videoId": "v1"}))
+        result = await create_request(api.url("/create"), {}, body={"prompt": "scene"})
+        return result, api.hits["/create"]
+    assert with_api(test) == (None, 1)
+
+def test_post_is_retried_on_429():
+    async def test(api):
+        api.script("/create", (429, {}), (200, {"videoId": "v1"}))
+        result = await create_request(api.url("/create"), {}, body={"prompt": "scene"})
+        return result, api.hits["/create"]
+    assert with_api(test) == ({"videoId": "v1"}, 2)
+
+def test_idempotent_post_opts_into_full_retries():
+    async def test(api):
+        api.script("/create", (503, {}), (200, {"ok": True}))
+        return await create_request(api.url("/create"), {}, body={}, idempotent=True)
+    assert with_api(test) == {"ok": True}
+
+def test_post_is_retried_when_the_connection_never_opened(capsys):
+    # nothing listens on this port, so the request certainly never reached an api
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    async def run():
+        try:
+            return await create_request(f"http://127.0.0.1:{port}/create", {}, body={})
+        finally:
+            await close_session()
+    assert asyncio.run(run()) is None
+    assert capsys.readouterr().out.count("Retrying request") == api_reqs.API_MAX_RETRIES
+
+def test_session_is_shared():
+    async def test(api):
+        api.script("/file", (200, {"bytes": 1}))
+        first = get_session()
+        data = await download_bytes(api.url("/file"))
+        return first is get_session(), data
+    assert with_api(test) == (True, b'{"bytes": 1}')
+
+@pytest.mark.parametrize("song_info, expected", [
+    ({"data": {"status": "Completed", "output": {"clips": {"c1": {"audio_url": "https://fake.song/1.mp3"}}}}}, "https://fake.song/1.mp3"),
+    ({"data": {"status": "Processing"}}, None),
+    ({"data": {"status": "Failed"}}, ""),
+    ({"data": {"status": "Completed", "output": {}}}, ""),
+])
+def test_song_status(monkeypatch, song_info, expected):
+    async def fake_request(*args, **kwargs):
+        return song_info
+    monkeypatch.setattr(api_reqs, "create_request", fake_request)
+    assert asyncio.run(api_reqs.check_song_status("task-1")) == expected
+
+def test_song_without_task_id_fails():
+    # a create response without a task id must not be polled forever
+    assert asyncio.run(api_reqs.check_song_status(None)) == ""
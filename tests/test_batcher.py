@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+import ctranslate2
+import numpy as np
+import pytest
+from faster_whisper.feature_extractor import FeatureExtractor
+from src.utils import batcher
+from src.utils.batcher import TranscriptionBatcher, transcribe_batch
+
+SPECIAL = ["<|endoftext|>", "<|startoftranscript|>", "<|en|>", "<|transcribe|>", "<|translate|>", "<|notimestamps|>"]
+
+
+class FakeHFTokenizer:
+    # text token i decodes to "window i", special tokens sit above <|endoftext|> like whisper's vocabulary
+    def token_to_id(self, token):
+        return 50000 + SPECIAL.index(token)
+
+    def decode(self, ids):
+        return " ".join(f"window {i}" for i in ids)
+
+class FakeCT2Whisper:
+    # the ctranslate2 model under WhisperModel.model, only records what the batched path hands it
+    is_multilingual = True
+    device = "cpu"
+    device_index = [0]
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.encoded = []
+        self.prompts = []
+
+    def encode(self, features, to_cpu=False):
+        assert isinstance(features, ctranslate2.StorageView)
+        self.encoded.append(list(features.shape))
+        return features
+
+    def generate(self, encoder_output, prompts, beam_size=5, max_length=448):
+        if self.fail:
+            raise RuntimeError("generate broke")
+        self.prompts.append(prompts)
+        return [SimpleNamespace(sequences_ids=[[i, 50000]]) for i in range(len(prompts))]
+
+class FakeWhisperModel:
+    # the parts of faster_whisper.WhisperModel the batcher touches, with the real 1.0.3 feature extractor
+    def __init__(self, fail=False):
+        self.feature_extractor = FeatureExtractor()
+        self.hf_tokenizer = FakeHFTokenizer()
+        self.model = FakeCT2Whisper(fail)
+        self.max_length = 448
+        self.single_calls = 0
+
+    def encode(self, features):
+        # WhisperModel.encode in 1.0.3 adds a batch axis, a stacked batch through it would be 4-D
+        raise AssertionError("the batched path must not go through WhisperModel.encode")
+
+    def transcribe(self, audio, **kwargs):
+        self.single_calls += 1
+        return [SimpleNamespace(text=f"single {len(audio)}")], None
+
+def windows(*seconds):
+    return [np.zeros(int(s * 16000), dtype=np.float32) for s in seconds]
+
+@pytest.fixture(autouse=True)
+def reset_batching(monkeypatch):
+    monkeypatch.setattr(batcher, "batching_failed", False)
+
+def test_batch_runs_one_encode_and_one_generate():
+    model = FakeWhisperModel()
+    texts = transcribe_batch(model, windows(1, 5, 30))
+    assert texts == ["window 0", "window 1", "window 2"]
+    assert model.model.encoded == [[3, 80, 3000]]
+    assert model.model.prompts == [[[50001, 50002, 50003, 50005]] * 3]
+    assert model.single_calls == 0
+    assert not batcher.batching_failed
+
+def test_broken_batch_falls_back_to_one_call_per_window():
+    model = FakeWhisperModel(fail=True)
+    assert transcribe_batch(model, windows(1, 2)) == ["single 16000", "single 32000"]
+    assert batcher.batching_failed
+    # not retried once it has failed
+    transcribe_batch(model, windows(1, 2))
+    assert model.model.encoded == [[2, 80, 3000]]
+
+def test_batcher_collects_windows_from_every_speaker():
+    model = FakeWhisperModel()
+
+    async def run():
+        batcher = TranscriptionBatcher(model, asyncio.get_running_loop(), max_batch_size=8, max_wait=0.05)
+        try:
+            return await asyncio.gather(*(batcher.transcribe(audio) for audio in windows(1, 2, 3, 4)))
+        finally:
+            batcher.stop()
+
+    assert asyncio.run(run()) == ["window 0", "window 1", "window 2", "window 3"]
+    assert model.model.encoded == [[4, 80, 3000]]
@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+from benchmarks.mock_api import MockAPI
+from src.utils import video_utils
+from src.utils.api_reqs import close_session, get_session
+from src.utils.video_utils import download_file
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(video_utils, "DOWNLOAD_RETRY_BACKOFF", 0)
+
+def download(api_setup, path, delay=0):
+    async def run():
+        api = await MockAPI(delay).start()
+        api_setup(api)
+        try:
+            result = await download_file(get_session(), api.url("/clip.mp4"), path)
+            return result, api.hits.get("/clip.mp4", 0)
+        finally:
+            await close_session()
+            await api.stop()
+    return asyncio.run(run())
+
+def test_download_is_retried_on_5xx(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    result = download(lambda api: api.script("/clip.mp4", (503, {}), (502, {}), (200, {"frames": 1})), path)
+    assert result == (path, 3)
+    assert open(path).read() == '{"frames": 1}'
+
+def test_missing_file_is_not_retried(tmp_path):
+    assert download(lambda api: api.script("/clip.mp4", (404, {})), str(tmp_path / "clip.mp4")) == (None, 1)
+
+def test_stalled_download_gives_up_with_none(tmp_path, monkeypatch):
+    # the cdn never sends a byte within the read timeout
+    monkeypatch.setattr(video_utils, "DOWNLOAD_READ_TIMEOUT", 0.05)
+    result = download(lambda api: None, str(tmp_path / "clip.mp4"), delay=0.3)
+    assert result == (None, video_utils.DOWNLOAD_MAX_RETRIES + 1)
@@ -0,0 +1,43 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from src.utils import llm_cache
+from src.utils.llm_cache import LLMCache, cached_completion
+
+
+def test_truncated_entry_is_a_miss_and_dropped(tmp_path):
+    cache = LLMCache(directory=str(tmp_path))
+    cache.set("k", "content")
+    with open(cache.path("k"), "w") as f:
+        f.write('{"content": "cont')
+    assert cache.get("k") is None
+    assert not os.path.exists(cache.path("k"))
+    cache.set("k", "content")
+    assert cache.get("k") == "content"
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+def test_set_leaves_no_temp_files(tmp_path):
+    cache = LLMCache(directory=str(tmp_path))
+    cache.set("k", "content", tokens=10)
+    assert os.listdir(tmp_path) == ["k.json"]
+
+def test_use_cache_false_always_calls_the_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "llm_cache", LLMCache(directory=str(tmp_path)))
+    calls = []
+
+    async def create(**request):
+        calls.append(request)
+        message = SimpleNamespace(content=f"reply {len(calls)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+
+    async def run():
+        return [
+            await cached_completion(client, **request),
+            await cached_completion(client, **request),
+            await cached_completion(client, use_cache=False, **request),
+        ]
+
+    assert asyncio.run(run()) == ["reply 1", "reply 1", "reply 2"]
@@ -0,0 +1,23 @@
+from src.utils import models
+from src.utils.models import ModelRegistry
+
+MB = 1024 * 1024
+
+
+def fake_loader(name, device, compute_type):
+    # a "model" that really is resident, so the rss based size is measured
+    return b"\x01" * (int(name) * MB)
+
+def test_least_recently_used_model_is_evicted_over_the_limit(monkeypatch):
+    monkeypatch.setitem(models.LOADERS, "fake", fake_loader)
+    registry = ModelRegistry(memory_limit_mb=300)
+    registry.get("fake", "200")
+    registry.get("fake", "150")
+    assert list(registry.models) == [("fake", "150")]
+    assert registry.metrics[("fake", "150")]["resident_mb"] > 100
+
+def test_models_are_loaded_once(monkeypatch):
+    monkeypatch.setitem(models.LOADERS, "fake", fake_loader)
+    registry = ModelRegistry()
+    assert registry.get("fake", "1") is registry.get("fake", "1")
+    assert registry.metrics[("fake", "1")]["uses"] == 2
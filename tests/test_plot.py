@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+import pytest
+from aiohttp import web
+from openai import AsyncOpenAI
+from benchmarks.mock_api import MockAPI
+from benchmarks.scheduler_sim import FakeVideoBackend
+from src import manager as manager_module
+from src.manager import GenerationManager
+from src.utils import plot
+from src.utils.api_reqs import close_session
+from src.utils.checkpoint import Checkpoint
+from src.utils.plot import PlotManager
+
+# which call a request is, from a phrase in its system prompt
+CALLS = {
+    "creative writer": "lyrics",
+    "detailed scene prompts": "scenes",
+    "YouTube video title": "youtube",
+    "progress messages": "progress",
+    "font": "subtitles",
+}
+REPLIES = {
+    "lyrics": "Tags: pop punk\nLyrics: we queued up at midnight\nVisual Theme: neon arcade",
+    "youtube": json.dumps({"title": "t", "description": "d", "tags": ["a"], "categoryId": "10"}),
+    "progress": "cooking\nalmost there",
+    "subtitles": json.dumps({"font": "Arial", "font_color": "#ff00ff"}),
+}
+SCENE_CHUNKS = ["**Scene 1:** a neon ", "arcade at night\n", "**Scene 2:** the queue ", "stretches out the door\n", "**Scene 3:** sunrise"]
+
+
+class FakeLLM(MockAPI):
+    # openai compatible /v1/chat/completions, logs when each call starts and ends
+    def __init__(self, delay=0.2, chunk_delay=0.1):
+        super().__init__(delay)
+        self.chunk_delay = chunk_delay
+        self.timeline = []  # (call, start, end)
+
+    def call_name(self, body):
+        system = body["messages"][0]["content"]
+        if isinstance(system, list):
+            system = "".join(part.get("text", "") for part in system)
+        return next(name for phrase, name in CALLS.items() if phrase in system)
+
+    async def handle(self, request):
+        body = await request.json()
+        name = self.call_name(body)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        if body.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for chunk in SCENE_CHUNKS:
+                await asyncio.sleep(self.chunk_delay)
+                delta = {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(delta)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            self.timeline.append((name, start, loop.time()))
+            return response
+        await asyncio.sleep(self.delay)
+        self.timeline.append((name, start, loop.time()))
+        return web.json_response({
+            "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLIES[name]}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    def span(self, name):
+        return next((start, end) for call, start, end in self.timeline if call == name)
+
+def with_llm(test):
+    async def run():
+        llm = await FakeLLM().start()
+        client = AsyncOpenAI(api_key="fake", base_url=llm.url("/v1"))
+        original = plot.client
+        plot.client = client
+        try:
+            manager = PlotManager()
+            manager.client = client
+            return await test(manager, llm)
+        finally:
+            plot.client = original
+            await client.close()
+            await llm.stop()
+    return asyncio.run(run())
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # cached completions are written under ./.llm_cache
+    monkeypatch.chdir(tmp_path)
+
+def test_scenes_are_yielded_while_streaming():
+    async def test(manager, llm):
+        loop = asyncio.get_running_loop()
+        yielded = []
+        async for scene in manager.stream_scenes("transcript", "lyrics", 3):
+            yielded.append((scene, loop.time()))
+        return yielded, llm.span("scenes")
+
+    yielded, (_, stream_end) = with_llm(test)
+    assert [scene.split(":**")[0] for scene, _ in yielded] == ["1", "2", "3"]
+    # the first scene is handed over while the rest of the completion is still streaming
+    assert yielded[0][1] < stream_end - 0.1
+
+class FakeChannel:
+    # records what the manager posts and when, messages can be edited
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, file=None):
+        self.sent.append((asyncio.get_running_loop().time(), content, file.filename if file else None))
+        return SimpleNamespace(id=len(self.sent), edit=self.edit)
+
+    async def edit(self, content=None):
+        pass
+
+def fake_media(monkeypatch, backend):
+    # song, video, render and upload backends stubbed, only the llm calls go over http
+    submitted = []
+
+    async def create_video_request(prompt, scene_number):
+        submitted.append(asyncio.get_running_loop().time())
+        return await backend.submit(prompt)
+
+    async def create_song_request(lyrics, tags):
+        return "song-1"
+
+    async def check_song_status(song_task_id):
+        return "https://fake.song/1.mp3"
+
+    async def download_file(session, url, filename):
+        return touch(filename)
+
+    async def normalize_clip(video_path, output_path):
+        return touch(output_path)
+
+    async def merge_videos_and_song(song_path, video_paths, ass_path, compressed_output_path, target_size_mb, output_path, on_progress):
+        touch(compressed_output_path)
+        return touch(output_path)
+
+    class FakeUploader:
+        def __init__(self, client_secret_file):
+            pass
+
+        def upload_video(self, path, youtube_data):
+            return f"https://youtu.be/{youtube_data['title']}"
+
+    for name, value in {
+        "create_video_request": create_video_request,
+        "get_video_status": backend.status,
+        "create_song_request": create_song_request,
+        "check_song_status": check_song_status,
+        "download_file": download_file,
+        "normalize_clip": normalize_clip,
+        "align_lyrics_to_file": lambda song_path, lyrics, path: touch(path),
+        "load_alignment": lambda path: object(),
+        "write_subtitles": lambda alignment, properties, ass_path: touch(ass_path),
+        "merge_videos_and_song": merge_videos_and_song,
+        "YouTubeUploader": FakeUploader,
+    }.items():
+        monkeypatch.setattr(manager_module, name, value)
+    return submitted
+
+def touch(path):
+    with open(path, "w") as f:
+        f.write("fake")
+    return path
+
+def test_generate_video_overlaps_llm_calls_in_dependency_order(monkeypatch, fast_polling):
+    # the real GenerationManager against the fake llm, from a checkpoint that already has the transcript
+    submitted = fake_media(monkeypatch, FakeVideoBackend(failure_rate=0, latency=0, min_duration=10, max_duration=20))
+    generation_id = "1700000000000"
+    Checkpoint(generation_id).set("transcript", "transcript")
+    channel = FakeChannel()
+
+    async def test(_, llm):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        manager = GenerationManager(channel, sink=None, generation_id=generation_id)
+        try:
+            await manager.generate_video()
+        finally:
+            await close_session()
+        return loop.time() - start, llm, manager
+
+    elapsed, llm, manager = with_llm(test)
+    lyrics, scenes, subtitle, metadata, messages = (llm.span(name) for name in ("lyrics", "scenes", "subtitles", "youtube", "progress"))
+    # dependencies finish before their dependents start
+    assert lyrics[1] <= min(scenes[0], subtitle[0])
+    assert scenes[1] <= min(metadata[0], messages[0])
+    # independent calls are in flight at the same time
+    assert subtitle[0] < scenes[1] and scenes[0] < subtitle[1]
+    assert metadata[0] < messages[1] and messages[0] < metadata[1]
+    # each scene's video is submitted as it streams in, not after the whole completion
+    assert len(submitted) == 3 and submitted[0] < scenes[1]
+    # the compressed render and the youtube link were posted, then the working files cleaned up
+    assert [file for _, _, file in channel.sent if file] == ["compressed_output.mp4"]
+    assert channel.sent[-1][1] == "https://youtu.be/t"
+    assert not os.path.exists(manager.checkpoint.directory)
+    # lyrics 0.2 + scene stream 0.5 + metadata 0.2, instead of 1.3 s one after another
+    assert elapsed < 1.1
@@ -0,0 +1,111 @@
+import asyncio
+from benchmarks import scheduler_sim
+from benchmarks.scheduler_sim import FakeVideoBackend
+from src.utils import polling
+from src.utils.scheduler import JobScheduler, JobState
+from config.constants import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL
+
+
+def make_scheduler(backend, concurrency=3, max_retries=2, on_complete=None):
+    return JobScheduler(
+        submit=lambda job: backend.submit(job.prompt),
+        check=backend.status,
+        concurrency=concurrency,
+        typical_duration=0.05,
+        max_retries=max_retries,
+        on_complete=on_complete,
+    )
+
+def test_failed_scene_is_resubmitted(fast_polling):
+    backend = FakeVideoBackend(latency=0, min_duration=10, max_duration=20)
+    outcomes = iter(["", "https://fake.video/ok.mp4"])
+    status = backend.status
+
+    async def flaky_status(job_id):
+        # first attempt fails, the resubmitted one succeeds
+        result = await status(job_id)
+        return next(outcomes) if result is not None else None
+
+    backend.status = flaky_status
+    completed = []
+
+    async def on_complete(job):
+        completed.append(job)
+
+    async def run():
+        return await make_scheduler(backend, on_complete=on_complete).run(["scene 1"])
+
+    [job] = asyncio.run(run())
+    assert job.state == JobState.DONE
+    assert job.attempts == 2
+    assert job.result == "https://fake.video/ok.mp4"
+    assert completed == [job]
+
+def test_scene_fails_after_max_retries(fast_polling):
+    backend = FakeVideoBackend(failure_rate=1, latency=0, min_duration=1, max_duration=2)
+    [job] = asyncio.run(make_scheduler(backend, max_retries=2).run(["scene 1"]))
+    assert job.state == JobState.FAILED
+    assert backend.submitted() == 3
+
+def test_resumed_job_is_polled_not_resubmitted(fast_polling):
+    backend = FakeVideoBackend(failure_rate=0, latency=0, min_duration=1, max_duration=2)
+
+    async def run():
+        job_id = await backend.submit("scene 1")
+        scheduler = make_scheduler(backend)
+        scheduler.add("scene 1", job_id=job_id)
+        return await scheduler.join()
+
+    [job] = asyncio.run(run())
+    assert job.state == JobState.DONE
+    assert backend.submitted() == 1
+
+def test_concurrency_is_capped(fast_polling):
+    backend = FakeVideoBackend(failure_rate=0, latency=0, min_duration=5, max_duration=10)
+    in_flight = [0]
+    peak = [0]
+    submit = backend.submit
+
+    async def tracking_submit(prompt):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        return await submit(prompt)
+
+    async def on_complete(job):
+        in_flight[0] -= 1
+
+    backend.submit = tracking_submit
+    jobs = asyncio.run(make_scheduler(backend, concurrency=3, on_complete=on_complete).run([f"scene {i}" for i in range(12)]))
+    assert all(job.state == JobState.DONE for job in jobs)
+    assert backend.submitted() == 12
+    assert peak[0] == 3
+
+def test_scheduler_beats_legacy_loop(monkeypatch):
+    # 12 scenes at concurrency 3 on the simulated backend, no failures so both deliver every video
+    monkeypatch.setattr(polling, "POLL_MIN_INTERVAL", POLL_MIN_INTERVAL * scheduler_sim.SCALE)
+    monkeypatch.setattr(polling, "POLL_MAX_INTERVAL", POLL_MAX_INTERVAL * scheduler_sim.SCALE)
+    scenes = [f"scene {i + 1}" for i in range(12)]
+    results = asyncio.run(scheduler_sim.compare(scenes, 3, seed=0, failure_rate=0))
+    assert results["scheduler"]["delivered"] == results["legacy"]["delivered"] == 12
+    assert results["scheduler"]["minutes"] < results["legacy"]["minutes"]
+
+def test_stuck_job_is_resubmitted_after_max_wait(fast_polling):
+    submitted = []
+
+    async def submit(job):
+        submitted.append(job.index)
+        return f"job-{len(submitted)}"
+
+    async def check(job_id):
+        # the first submission never finishes upstream
+        return None if job_id == "job-1" else "https://fake.video/ok.mp4"
+
+    scheduler = JobScheduler(submit=submit, check=check, concurrency=1, typical_duration=0.05, max_wait=0.05)
+    [job] = asyncio.run(scheduler.run(["scene 1"]))
+    assert job.state == JobState.DONE
+    assert job.job_id == "job-2"
+
+def test_poll_until_gives_up_after_max_wait(fast_polling):
+    async def pending():
+        return None
+    assert asyncio.run(polling.poll_until(pending, 0.05, max_wait=0.05)) == ""
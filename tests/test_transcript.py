@@ -0,0 +1,79 @@
+import asyncio
+import io
+import time
+import types
+import pytest
+from aiohttp import web
+from deepgram import DeepgramClient, DeepgramClientOptions, PrerecordedOptions
+from benchmarks.mock_api import MockAPI
+from src.utils.transcript import transcribe_audio
+
+# what each speaker "said": (start, word), already in time order as deepgram returns them
+SPEECH = {
+    1: [(0.0, "hey"), (2.0, "did"), (4.5, "you")],
+    2: [(1.0, "yo"), (2.0, "what"), (3.0, "up")],
+    3: [(0.5, "lol"), (5.0, "nice")],
+}
+
+
+class FakeDeepgram(MockAPI):
+    # answers /v1/listen like the prerecorded api, the uploaded audio names the speaker
+    def __init__(self, delay=0):
+        super().__init__(delay)
+        self.in_flight = 0
+        self.peak = 0
+
+    async def handle(self, request):
+        speaker = int((await request.read()).decode().split("-")[1])
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        words = [
+            {"word": word, "start": start, "end": start + 0.4, "confidence": 0.9, "punctuated_word": word.capitalize(), "speaker": 0, "speaker_confidence": 0.8}
+            for start, word in SPEECH.get(speaker, [])
+        ]
+        return web.json_response({"metadata": {"request_id": "fake"}, "results": {"channels": [{"alternatives": [{"transcript": "", "confidence": 0.9, "words": words}]}]}})
+
+def make_sink(speakers):
+    # stands in for the py-cord sink, each recording is a file-like object
+    return types.SimpleNamespace(audio_data={speaker: types.SimpleNamespace(file=io.BytesIO(f"speaker-{speaker}".encode())) for speaker in speakers})
+
+def transcribe(speakers, delay=0, max_concurrency=4):
+    async def run():
+        backend = await FakeDeepgram(delay).start()
+        try:
+            deepgram = DeepgramClient("fake-key", DeepgramClientOptions(url=f"http://127.0.0.1:{backend.port}"))
+            start = time.perf_counter()
+            words = await transcribe_audio(make_sink(speakers), deepgram, PrerecordedOptions(model="nova-2"), max_concurrency)
+            return words, time.perf_counter() - start, backend.peak
+        finally:
+            await backend.stop()
+    return asyncio.run(run())
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # transcribe_speaker keeps a copy of every upload under ./audio
+    monkeypatch.chdir(tmp_path)
+
+def test_words_are_merged_in_time_order():
+    words, _, _ = transcribe([1, 2, 3])
+    assert [(word["start"], word["speaker"]) for word in words] == sorted(
+        (start, speaker) for speaker, speech in SPEECH.items() for start, _ in speech
+    )
+    assert [word["punctuated_word"] for word in words][:4] == ["Hey", "Lol", "Yo", "Did"]
+
+def test_speakers_are_transcribed_concurrently():
+    words, elapsed, peak = transcribe([1, 2, 3], delay=0.3)
+    assert len(words) == 8
+    assert peak == 3
+    assert elapsed < 0.6
+
+def test_concurrency_is_capped():
+    _, elapsed, peak = transcribe([1, 2, 3, 4, 5, 6], delay=0.2, max_concurrency=2)
+    assert peak == 2
+    assert elapsed >= 0.6
+
+def test_speaker_without_words():
+    words, _, _ = transcribe([1, 9])
+    assert [word["speaker"] for word in words] == [1, 1, 1]
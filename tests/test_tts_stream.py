@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import numpy as np
+from discord.opus import Encoder as OpusEncoder
+from benchmarks.tts_first_audio import FREQUENCY, FakeTTS, buffered, post, streamed, wav_header
+from src.utils.api_reqs import close_session
+from src.utils.tts_stream import SILENT_FRAME, TTSStreamSource, strip_wav_header
+from config.constants import TTS_SAMPLE_RATE
+
+
+async def against(api, *steps):
+    await api.start()
+    try:
+        return [await step(api.url("/v1/tts")) for step in steps]
+    finally:
+        await close_session()
+        await api.stop()
+
+def test_first_audio_arrives_before_generation_finishes():
+    # 2 s of audio at 2x realtime takes the fake model about 1.1 s to finish
+    old, new = asyncio.run(against(FakeTTS(seconds=2, speed=2, latency=0.1), buffered, streamed))
+    assert old["first_audio"] > 1.0
+    assert new["first_audio"] < 0.5
+    assert new["underruns"] == 0
+
+def test_streamed_audio_is_the_whole_reply_at_48k_stereo():
+    new, = asyncio.run(against(FakeTTS(seconds=1, speed=4, latency=0), streamed))
+    samples = np.frombuffer(new["pcm"], dtype=np.int16).reshape(-1, OpusEncoder.CHANNELS)
+    # the last frame is padded up to 20 ms
+    assert abs(len(samples) - OpusEncoder.SAMPLING_RATE) <= OpusEncoder.SAMPLES_PER_FRAME
+    assert np.array_equal(samples[:, 0], samples[:, 1])
+    spectrum = np.abs(np.fft.rfft(samples[:OpusEncoder.SAMPLING_RATE // 2, 0]))
+    assert abs(np.argmax(spectrum) * 2 - FREQUENCY) <= 2
+
+def test_wav_header_split_across_chunks():
+    header = wav_header(TTS_SAMPLE_RATE)
+    assert strip_wav_header(header[:20]) == (header[:20], False)
+    assert strip_wav_header(header + b"\x01\x02") == (b"\x01\x02", True)
+    assert strip_wav_header(b"\x01\x02\x03\x04") == (b"\x01\x02\x03\x04", True)
+
+def test_underrun_plays_silence_and_cleanup_stops_the_feed():
+    async def run(url):
+        response = await post(url)
+        source = TTSStreamSource()
+        source.loop = asyncio.get_running_loop()
+        source.feed_task = asyncio.create_task(source.feed(response, 0))
+        # nothing has been generated yet, the player still gets a frame
+        assert await asyncio.to_thread(source.read) == SILENT_FRAME
+        # playback stopped from the player thread, like vc.stop() would
+        threading.Thread(target=source.cleanup).start()
+        await asyncio.wait_for(asyncio.gather(source.feed_task, return_exceptions=True), 1)
+        return source
+
+    source, = asyncio.run(against(FakeTTS(seconds=30, speed=1, latency=0.5), run))
+    assert source.feed_task.cancelled()
+    assert source.frames.get_nowait() is None